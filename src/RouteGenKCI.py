@@ -5,14 +5,18 @@
 ####################################################################################
 import numpy as np
 import pandas as pd
-from pulp import *
 import random
+import time
 from scipy.cluster.vq import kmeans2, whiten
-from sklearn.cluster import DBSCAN
 from os import sep
-import matplotlib.pyplot as plt
-
-def KRegionalClusters(locationData, k=10, plot=False):
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from traveltimes import TravelTimeMatrix
+from solvers import BinaryModel, Solve
+from stores import StoreRegistry
+from instrument import tracer
+
+def KRegionalClusters(locationData, k=10, plot=False, seed=None):
     '''
     Separate supermarkets into k clusters such that route generation for each cluster/region is possible
 
@@ -24,6 +28,9 @@ def KRegionalClusters(locationData, k=10, plot=False):
     plot : boolean
     True if we want to plot the data
 
+    seed : integer
+    Seed for the k means initialisation, None for a different clustering every run
+
     Returns
     -------
 
@@ -37,19 +44,23 @@ def KRegionalClusters(locationData, k=10, plot=False):
     # Extract out only the longitude and latitude values for each supermarket (retains order)
     coord = locationData[["Long", "Lat"]].values
 
-    # Plot the supermarkets
-    x = [x[0] for x in coord]
-    y = [y[1] for y in coord]
-    f1 = plt.figure()
-    f1 = plt.scatter(x, y)
-
     # Use k means algorithm to form regions/clusters
-    c, l = kmeans2(whiten(coord), k, iter = 50)
+    with tracer.stage("clustering", k = k, stores = len(coord)):
+        c, l = kmeans2(whiten(coord), k, iter = 50, seed = seed)
 
-    # Plot the supermarkets based on its region
-    f2 = plt.figure()
-    f2 = plt.scatter(x, y, c=l)
     if plot:
+        # Plotting is the only thing that needs matplotlib, import it here so route generation starts fast
+        import matplotlib.pyplot as plt
+
+        # Plot the supermarkets
+        x = [x[0] for x in coord]
+        y = [y[1] for y in coord]
+        f1 = plt.figure()
+        f1 = plt.scatter(x, y)
+
+        # Plot the supermarkets based on its region
+        f2 = plt.figure()
+        f2 = plt.scatter(x, y, c=l)
         plt.show()
 
     return l
@@ -72,7 +83,224 @@ def CreateRegionsFromKMeans(locationData, l):
         regions.append(CurrentRegion)
     return regions
 
-def CheapestInsertion(nodes, weights, centralNode = None):
+def CheapestInsertionArray(nodes, W, centralNode = None):
+    '''
+    Integer indexed cheapest insertion engine working directly on a travel time ndarray
+
+    Inputs
+    ------
+    nodes : np.array/list
+    Integer indices (into W) of the nodes to find optimal tour
+
+    W : np.ndarray
+    Square matrix where W[i, j] is the weight between node i and node j, i.e. the
+    same value as weights[i][j] for the label based dataframe
+
+    centralNode : integer
+    Index of the central distribution node, the starting/ending node of the tour
+
+    Returns
+    -------
+    finalTour : list
+        list of integer indices representing a tour of supermarkets
+    finalTourWeight : float
+        number representing the weight of the final tour
+
+    Notes:
+    ------
+    Each step prices every (uninserted node, tour position) pair with a single broadcasted
+    array operation. Ties are broken exactly like CheapestInsertion (node order, then position).
+    '''
+    nodes = np.asarray(nodes, dtype = np.intp)
+
+    # Cheapest insertion can still function even if we randomly assign a central node
+    if centralNode is None:
+        centralNode = int(random.choice(nodes))
+
+    # Boolean mask of the nodes which are already in the tour
+    inTour = np.zeros(W.shape[0], dtype = bool)
+
+    # Initialise algorithm with the nearest node to the central node
+    firstNode = int(nodes[np.nanargmin(W[centralNode, nodes])])
+    finalTour = [centralNode, firstNode]
+    finalTourWeight = W[centralNode, firstNode]
+    inTour[centralNode] = True
+    inTour[firstNode] = True
+
+    # While each node/sm not in final tour
+    while len(finalTour) <= len(nodes):
+        candidates = nodes[~inTour[nodes]]
+        tour = np.asarray(finalTour, dtype = np.intp)
+        left, right = tour[:-1], tour[1:]
+
+        # insertionWeight[k, i] is the tour weight after inserting candidates[k] between positions i and i+1
+        insertionWeight = finalTourWeight + W[np.ix_(left, candidates)].T + W[np.ix_(candidates, right)] - W[left, right]
+
+        # First minimum in row major order matches the (node, position) scan order of the original loops
+        k, i = divmod(int(np.nanargmin(insertionWeight)), len(left))
+
+        # Update final tour after cheapest insertion
+        finalTour.insert(i + 1, int(candidates[k]))
+        finalTourWeight = insertionWeight[k, i]
+        inTour[candidates[k]] = True
+
+    # Complete node by adding back central node, the tour returns along the last node -> central node arc
+    finalTourWeight += W[finalTour[-1], centralNode]
+    finalTour.append(centralNode)
+
+    return finalTour, float(finalTourWeight)
+
+# Improving moves LocalSearchArray makes per tour, this bound (not time) is what stops a search
+# so the same node set always gives the same tour
+localSearchMoves = 1000
+
+# Wall clock safety cap (seconds) per tour, far above what any tour of a truck's stores needs
+localSearchTime = 1.0
+
+def LocalSearchArray(tour, W, maxMoves = None, timeLimit = None, neighbours = 8, maxSegment = 3, tol = 1e-7):
+    '''
+    Improves a tour with 2-opt and Or-opt moves until no move improves it or maxMoves moves are made
+
+    Inputs
+    ------
+    tour : list
+    Integer indices (into W) of a closed tour, first and last entry are the central node
+
+    W : np.ndarray
+    Square matrix where W[i, j] is the weight between node i and node j, need not be symmetric
+
+    maxMoves : integer
+    Most improving moves made, localSearchMoves if None
+
+    timeLimit : float
+    Seconds allowed, localSearchTime if None. Only meant as a safety net, a search stopped by
+    it depends on the machine's speed and is not reproducible
+
+    neighbours : integer
+    Length of each node's neighbour list, moves only create arcs to these nodes
+
+    maxSegment : integer
+    Longest run of stores an Or-opt move relocates
+
+    tol : float
+    Smallest decrease in weight that counts as an improvement
+
+    Returns
+    -------
+    finalTour : list
+        improved tour of integer indices, same central node at both ends
+    finalTourWeight : float
+        weight of the improved tour
+
+    Notes:
+    ------
+    Every move is priced in O(1) from prefix sums of the tour's arc weights in both directions,
+    so reversing a segment of an asymmetric matrix costs the difference of two prefix sums.
+    Nodes whose moves all fail get their don't look bit set and are only looked at again once a
+    move changes one of their arcs. The prefix sums are rebuilt (O(n)) after each accepted move.
+    '''
+    deadline = time.perf_counter() + (localSearchTime if timeLimit is None else timeLimit)
+    movesLeft = localSearchMoves if maxMoves is None else maxMoves
+    tour = [int(node) for node in tour]
+    n = len(tour) - 1
+    central = tour[0]
+    if n < 3:
+        return tour, float(sum(W[tour[t], tour[t+1]] for t in range(n)))
+
+    # Nearest nodes of each tour node, by the cheaper direction between them
+    members = np.asarray(tour[:-1], dtype = np.intp)
+    sub = W[np.ix_(members, members)]
+    sub = np.minimum(sub, sub.T).astype(float)
+    np.fill_diagonal(sub, np.inf)
+    order = np.argsort(sub, axis = 1, kind = "stable")[:, :min(neighbours, n - 1)]
+    near = {int(members[r]): [int(members[c]) for c in order[r]] for r in range(n)}
+
+    def Rebuild():
+        t = np.asarray(tour, dtype = np.intp)
+        fwd = np.concatenate([[0.0], np.cumsum(W[t[:-1], t[1:]])])
+        bwd = np.concatenate([[0.0], np.cumsum(W[t[1:], t[:-1]])])
+        pos = {node: k for k, node in enumerate(tour[:-1])}
+        return fwd, bwd, pos
+
+    def Reversal(i, j):
+        # Change in the weight of the arcs between positions i and j when they are walked backwards
+        return (bwd[j] - bwd[i]) - (fwd[j] - fwd[i])
+
+    def TwoOpt(v):
+        # Reverse tour[i..j] so that a new arc starts or ends at v
+        moves = []
+        if v == central or pos[v] < n - 1:
+            i = pos[v] + 1
+            for c in near[v]:
+                if c != central and pos[c] > i:
+                    moves.append((i, pos[c]))
+        if v != central:
+            i = pos[v]
+            for d in near[v]:
+                j = (n if d == central else pos[d]) - 1
+                if j > i:
+                    moves.append((i, j))
+        for i, j in moves:
+            a, b, c, d = tour[i-1], tour[i], tour[j], tour[j+1]
+            delta = W[a, c] + W[b, d] - W[a, b] - W[c, d] + Reversal(i, j)
+            if delta < -tol:
+                tour[i:j+1] = tour[i:j+1][::-1]
+                return (a, b, c, d)
+        return None
+
+    def OrOpt(v):
+        # Move a run of up to maxSegment stores starting or ending at v next to one of v's neighbours
+        if v == central:
+            return None
+        for length in range(1, maxSegment + 1):
+            for i in dict.fromkeys((pos[v], pos[v] - length + 1)):
+                j = i + length - 1
+                if i < 1 or j > n - 1:
+                    continue
+                p, first, last, q = tour[i-1], tour[i], tour[j], tour[j+1]
+                removal = W[p, first] + W[last, q] - W[p, q]
+                positions = {0, n - 1}
+                for u in near[v]:
+                    if u == central:
+                        continue
+                    positions.update((pos[u], pos[u] - 1))
+                for k in sorted(positions):
+                    if i - 1 <= k <= j or k < 0 or k > n - 1:
+                        continue
+                    x, y = tour[k], tour[k+1]
+                    forward = W[x, first] + W[last, y] - W[x, y]
+                    backward = W[x, last] + W[first, y] - W[x, y] + Reversal(i, j)
+                    delta = min(forward, backward) - removal
+                    if delta < -tol:
+                        segment = tour[i:j+1] if forward <= backward else tour[i:j+1][::-1]
+                        del tour[i:j+1]
+                        k = k - length if k > j else k
+                        tour[k+1:k+1] = segment
+                        return (p, q, first, last, x, y)
+        return None
+
+    fwd, bwd, pos = Rebuild()
+    active = deque(tour[:-1])
+    queued = set(active)
+    while active and movesLeft > 0:
+        if time.perf_counter() > deadline:
+            tracer.count("localSearch.timeouts")
+            break
+        v = active.popleft()
+        queued.discard(v)
+        changed = TwoOpt(v) or OrOpt(v)
+        if changed is None:
+            continue
+        movesLeft -= 1
+        fwd, bwd, pos = Rebuild()
+        for node in (v,) + changed:
+            if node not in queued:
+                active.append(node)
+                queued.add(node)
+
+    return tour, float(fwd[n])
+
+def CheapestInsertion(nodes, weights, centralNode = None, improve = False):
     '''
     Cheapest insertion heuristics to compute the most optimal tour for a given set of nodes 
 
@@ -81,67 +309,319 @@ def CheapestInsertion(nodes, weights, centralNode = None):
     nodes : np.array/list 
     Current nodes to find optimal tour  
 
-    weights : pd.dataframe
+    weights : pd.dataframe/TravelTimeMatrix
     Distance, time, or any unit of measurement between nodes 
 
     centralNode : String  
     Central distribution node is the starting/ending node of the tour  
 
+    improve : boolean
+    True to improve the tour with 2-opt/Or-opt local search (LocalSearchArray) afterwards
+
     Returns
     -------
     finalTour : list
         list of strings representing a tour of supermarkets
     finalTourWeight : float
         number representing the weight of the final tour
+
+    Notes:
+    ------
+    Label based wrapper around CheapestInsertionArray (and LocalSearchArray).
     '''
     
     # Cheapest insertion can still function even if we randomly assign a central node 
     if centralNode == None:
         centralNode = random.choice(nodes)
 
-    finalTourWeight = 0 
-    # Start with one node in solution 
-    finalTour = [centralNode]
+    # Travel time matrix is already integer indexed so no need to copy out a sub matrix
+    if isinstance(weights, TravelTimeMatrix):
+        tourIdx, finalTourWeight = CheapestInsertionArray(weights.indices(nodes), weights.W, centralNode = weights.index[centralNode])
+        if improve:
+            tourIdx, finalTourWeight = _Improve(tourIdx, finalTourWeight, weights.W)
+        return [weights.stores[i] for i in tourIdx], finalTourWeight
 
-    # Initialise algorithm 
-    finalTour.append(weights[centralNode][nodes].idxmin())
-    finalTourWeight += weights[centralNode][nodes].min()
+    # Map labels to integer indices, central node first
+    labels = list(dict.fromkeys([centralNode] + list(nodes)))
+    position = {label: i for i, label in enumerate(labels)}
 
-    # While each node/sm not in final tour 
-    while len(finalTour) <= len(nodes):
-        
-        # On each iteration, reset the optimal route for adding new node/sm to final tour 
-        optimalTourWeight = float('inf')
-        optimalNodeToInsert = None
-        positionToInsert = None
-
-        # Loop through each node/sm to find nearest neighbour and add to tour 
-        for sm in nodes:
-            
-            # Check if node/sm already added to tour 
-            if sm in finalTour:
-                # Skip current iteration if node/sm already added to tour
-                continue 
-
-            # Otherwise determine weight/cost of insertion 
-            for i in range(len(finalTour)-1):
-                currentTourWeight = finalTourWeight + weights[finalTour[i]][sm] + weights[sm][finalTour[i+1]] - weights[finalTour[i]][finalTour[i+1]]
-                if currentTourWeight < optimalTourWeight:
-                    optimalTourWeight = currentTourWeight
-                    optimalNodeToInsert = sm
-                    positionToInsert = i+1
-
-        # Update final tour after cheapest insertion of all nodes 
-        finalTour.insert(positionToInsert, optimalNodeToInsert)
-        finalTourWeight = optimalTourWeight
-
-    # Complete node by adding back central node 
-    finalTourWeight += weights[centralNode][finalTour[-1]]
-    finalTour.append(centralNode)
+    # Transpose so that W[i, j] == weights[labels[i]][labels[j]]
+    W = weights.loc[labels, labels].to_numpy(dtype = float).T
+
+    tourIdx, finalTourWeight = CheapestInsertionArray([position[sm] for sm in nodes], W, centralNode = 0)
+    if improve:
+        tourIdx, finalTourWeight = _Improve(tourIdx, finalTourWeight, W)
+
+    return [labels[i] for i in tourIdx], finalTourWeight
+
+def _Improve(tourIdx, weight, W):
+    # Keep the insertion tour unless local search found a strictly cheaper one, so improving never costs more
+    improvedTour, improvedWeight = LocalSearchArray(tourIdx, W)
+    if improvedWeight < weight:
+        tracer.count("localSearch.improved")
+        tracer.count("localSearch.saving", weight - improvedWeight)
+        return improvedTour, improvedWeight
+    return tourIdx, weight
+
+class TourCache:
+    '''
+    Bounded LRU memo of CheapestInsertion results keyed by the frozen store set, the
+    central node, the travel time matrix version and whether the tour was improved
+
+    Inputs
+    ------
+    maxsize : integer
+    Maximum number of tours kept before the least recently used one is evicted
+    '''
+
+    def __init__(self, maxsize = 100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tours = OrderedDict()
+
+    def __len__(self):
+        return len(self._tours)
+
+    def get(self, key):
+        '''
+        Returns the cached (tour, weight) for key or None, counting the hit/miss
+        '''
+        if key in self._tours:
+            self._tours.move_to_end(key)
+            self.hits += 1
+            finalTour, finalTourWeight = self._tours[key]
+            return list(finalTour), finalTourWeight
+        self.misses += 1
+        return None
+
+    def put(self, key, finalTour, finalTourWeight):
+        self._tours[key] = (tuple(finalTour), finalTourWeight)
+        self._tours.move_to_end(key)
+        if len(self._tours) > self.maxsize:
+            self._tours.popitem(last = False)
+
+    def clear(self):
+        self._tours.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._tours),
+                "hitRate": self.hits / lookups if lookups else 0.0}
+
+# Shared by every route generation pass in this process
+tourCache = TourCache()
+
+def CachedCheapestInsertion(nodes, weights, centralNode = 'Warehouse', cache = None, improve = False):
+    '''
+    CheapestInsertion through the tour cache
+
+    Inputs
+    ------
+    nodes, weights, centralNode, improve
+    As for CheapestInsertion
+
+    cache : TourCache
+    Cache to use, the process wide tourCache by default
+
+    Notes:
+    ------
+    Only weights with a version (i.e. a TravelTimeMatrix) are cached, a plain dataframe
+    has no cheap way of telling that its values changed so it always goes straight through.
+    '''
+    version = getattr(weights, 'version', None)
+    if version is None:
+        return CheapestInsertion(nodes, weights, centralNode = centralNode, improve = improve)
+
+    if cache is None:
+        cache = tourCache
+
+    key = (frozenset(nodes), centralNode, version, improve)
+    tour = cache.get(key)
+    if tour is None:
+        tour = CheapestInsertion(nodes, weights, centralNode = centralNode, improve = improve)
+        cache.put(key, *tour)
+    return tour
+
+def EnumerateNodeSets(stores, demand, maxDemand = 12, minDemand = None, maximise = True, limit = 50):
+    '''
+    Streams supermarket node sets whose total demand lies within the truck capacity bounds,
+    in the same order the repeatedly re-solved no-good cut LP returns them
+
+    Inputs
+    ------
+    stores : list
+    Supermarkets in the current region
+
+    demand : list
+    Demand (pallets) of each supermarket, same order as stores
+
+    maxDemand : float
+    Truck capacity, total demand of a node set must not exceed this
+
+    minDemand : float
+    Lower bound on the total demand of a node set, None for no lower bound
+
+    maximise : boolean
+    True to yield node sets from largest to smallest cardinality (RouteConstruction),
+    False for smallest to largest (RouteConstruction2)
+
+    limit : integer
+    Maximum number of node sets to yield
+
+    Yields
+    ------
+    nodes : list
+        supermarkets in the node set, in region order
 
-    return finalTour, finalTourWeight
+    Notes:
+    ------
+    A no-good cut bans a node set and all of its supersets, so supersets of node sets already
+    yielded are skipped. Stores are searched in ascending demand so the capacity bounds prune
+    whole branches with prefix sums.
+    '''
+    n = len(stores)
+    order = sorted(range(n), key = lambda i: (demand[i], i))
+    d = [demand[i] for i in order]
+    prefix = [0]
+    for value in d:
+        prefix.append(prefix[-1] + value)
+
+    banned = []
+
+    def Combinations(start, r, total, mask):
+        if r == 0:
+            if minDemand is None or total >= minDemand:
+                yield mask
+            return
+        for j in range(start, n - r + 1):
+            # Cheapest way to finish from j, later j are only dearer since d is sorted
+            if total + prefix[j + r] - prefix[j] > maxDemand:
+                break
+            # Dearest way to finish from j still cannot reach the lower bound
+            if minDemand is not None and total + d[j] + prefix[n] - prefix[n - r + 1] < minDemand:
+                continue
+            # Every extension of a banned node set is banned too
+            extended = mask | 1 << order[j]
+            if any(extended & b == b for b in banned):
+                continue
+            yield from Combinations(j + 1, r - 1, total + d[j], extended)
+
+    sizes = range(n, 0, -1) if maximise else range(1, n + 1)
+    for p in sizes:
+        for mask in Combinations(0, p, 0, 0):
+            banned.append(mask)
+            yield [stores[i] for i in range(n) if mask >> i & 1]
+            if len(banned) >= limit:
+                return
+
+def SolveNodeSets(stores, demand, maxDemand = 12, minDemand = None, maximise = True, limit = 50, name = "RouteContructionRegion", backend = None):
+    '''
+    Legacy node set source: repeatedly solves the binary LP, banning each optimal node set
+    with a no-good cut. Same inputs and outputs as EnumerateNodeSets.
+
+    backend : string
+    Solver backend (see solvers.Solve), "highs" solves in-process and "pulp" spawns CBC
+    '''
+    # Form integer binary LP to figure out a supermarket "node" set that
+    # satisfies the demand constraint. Will be used for constructing
+    # routes (and its cost)
+    # Maximise/minimise the total number of supermarket in the route
+    prob = BinaryModel(np.ones(len(stores)), name, maximise, varName = "sm")
+
+    # Ensure route capacity is met
+    prob.addRows(np.asarray(demand, dtype = float), upper = maxDemand, names = ["MaxTruckCapacity"])
+    if minDemand is not None:
+        prob.addRows(np.asarray(demand, dtype = float), lower = minDemand, names = ["MinTruckCapacity"])
+
+    # The problem is solved to get different optimal solutions
+    for i in range(limit):
+        status, x, obj = Solve(prob, backend)
+
+        # If a new optimal solution cannot be found, we end the program
+        if status != "Optimal":
+            break
+
+        nodes = [stores[j] for j in range(len(stores)) if x[j] == 1]
+        yield nodes
+
+        # The constraint is added that the same solution cannot be returned again
+        prob.addRows(x, upper = len(nodes) - 1)
+
+def RegionRouteConstruction(stores, demand, weights, minDemand = None, maximise = True, limit = 50, solver = None, name = "RouteContructionRegion",
+                            capacity = 12, maxTime = 14400, improve = True):
+    '''
+    Construct the feasible routes of a single region
+
+    Inputs
+    ------
+    stores, demand : list
+    Supermarkets in the region and their demand
+
+    weights : pd.dataframe/TravelTimeMatrix
+    Distance, time, or any unit of measurement between nodes
+
+    minDemand, maximise, limit
+    As for EnumerateNodeSets
+
+    solver : string
+    None to enumerate node sets directly, otherwise the backend ("highs"/"pulp") that
+    solves the legacy re-solved no-good cut LP
+
+    capacity : float
+    Truck capacity (pallets)
+
+    maxTime : float
+    Routes must take less than this many seconds (driving plus unloading)
 
-def RouteConstruction(locationData, weights, l, demandPreds, weekday):
+    improve : boolean
+    True to shorten every cheapest insertion tour with 2-opt/Or-opt before the maxTime check
+
+    Returns
+    -------
+    routes : list
+        tours (lists of supermarkets starting and ending at the Warehouse)
+    costs : list
+        time in seconds to traverse each tour and unload at each supermarket
+    '''
+    if solver is None:
+        nodeSets = EnumerateNodeSets(stores, demand, capacity, minDemand, maximise, limit)
+    else:
+        nodeSets = SolveNodeSets(stores, demand, capacity, minDemand, maximise, limit, name, backend = solver)
+
+    routes = []
+    costs = []
+    tried = 0
+    with tracer.stage("region", region = name, stores = len(stores), minDemand = minDemand, maximise = maximise):
+        for tried, nodes in enumerate(nodeSets, 1):
+            # For current set of nodes, find the heuristic solution to the most optimal path 
+            # Using cheapest insertion 
+            with tracer.timer("cheapestInsertion"):
+                finalTour, finalTourWeight = CachedCheapestInsertion(nodes, weights, centralNode = 'Warehouse', improve = improve)
+            # Add time it takes to unload per supermarket
+            finalTourWeight += 300*(len(finalTour)-2)
+
+            # If the route takes less than four hours to traverse then append to list of optimal solutions 
+            if finalTourWeight < maxTime:
+                routes.append(finalTour)
+                costs.append(finalTourWeight)
+        tracer.count("routes.generated", len(routes))
+        tracer.count("routes.rejected", tried - len(routes))
+
+    return routes, costs
+
+def RegionDemand(locationData, smCurrentRegion, demandPreds, weekday, registry = None):
+    '''
+    Returns the predicted demand of each supermarket in the region on weekday, pass a
+    StoreRegistry built once from locationData/demandPreds to skip rebuilding it
+    '''
+    if registry is None:
+        registry = StoreRegistry(locationData, demandPreds)
+    return registry.demands(smCurrentRegion, weekday).tolist()
+
+def RouteConstruction(locationData, weights, l, demandPreds, weekday, limit = 50, solver = None, workers = 1):
     '''
     Construct routes per region by creating supermarket node sets that satisfy the
     requirments and constraints
@@ -151,7 +631,7 @@ def RouteConstruction(locationData, weights, l, demandPreds, weekday):
     locationData : pandas dataframe
     Basically dataframe of excel data
 
-    weights : pd.dataframe
+    weights : pd.dataframe/TravelTimeMatrix
     Distance, time, or any unit of measurement between nodes
 
     l : np.array
@@ -163,6 +643,15 @@ def RouteConstruction(locationData, weights, l, demandPreds, weekday):
     weekday : string 
     The day of the week to generate routes for 
 
+    limit : integer
+    Maximum number of node sets per region
+
+    solver : string
+    None (default) to enumerate node sets directly, "highs"/"pulp" for the legacy re-solved LP
+
+    workers : integer
+    Number of processes to fan the regions out to (see RoutePool)
+
     Returns:
     -------
     routeData : pd.DataFrame
@@ -175,92 +664,13 @@ def RouteConstruction(locationData, weights, l, demandPreds, weekday):
 
     Notes:
     ------
-    This method will work by repeatedly ban the optimal solution and resolve for more optimal routes. 
+    Node sets come largest first, i.e. the order you get by repeatedly banning the optimal
+    solution of the maximum cardinality LP and resolving.
     '''
-    # Get supermarket regions
-    # locationData, l = KRegionalClusters(k=3, plot=True)
-    # locationData = locationData[1:][:]
-    
-    routes = []
-    costs = []
-    # Loop through each region, identify possible locations, construct a set of feasible routes
-    for region in set(l):
-        
-        # Get supermarkets in current region and store in numpy array
-        smCurrentRegion = locationData[l==region]["Supermarket"]
-
-        # Construct supermarket data: demand and cost
-
-        # Helper function returns the value of demand for current store and weekday
-        def GetDemand(store):
-            store_type = locationData.loc[locationData["Supermarket"] == store, ["Type"]].values[0][0]
-            demandcol = demandPreds.loc[demandPreds["Supermarket Type"] == store_type]
-            return demandcol.loc[demandcol["Weekday"] == weekday, ["Demand"]].values[0]
-
-        Demand = []
-
-        for store in smCurrentRegion:
-            Demand.append(GetDemand(store))
-
-        Demand = pd.Series(Demand, index = smCurrentRegion)
+    return RoutePool(locationData, weights, l, demandPreds, weekday, [(None, True)], limit, solver, workers)
 
-        Cost = pd.Series([1]*len(smCurrentRegion), index = smCurrentRegion)
 
-        # Form integer binary LP to figure out a supermarket "node" set that
-        # satisfies the demand constraint. Will be used for constructing
-        # routes (and its cost)
-        prob = LpProblem("RouteContructionRegion" + str(region), LpMaximize)
-
-        # Create binary variables
-        smVars = LpVariable.dicts("sm", smCurrentRegion, 0, cat = "Binary")
-
-        # Maximise the total number of supermarket in the route
-        prob += lpSum([Cost[i] * smVars[i] for i in smCurrentRegion]), "Total Supermarkets in Route"
-
-        # Ensure route capacity is met
-        prob += lpSum([Demand[i] * smVars[i] for i in smCurrentRegion]) <= 12, "MaxTruckCapacity"
-
-        # The problem data is written to an .lp file
-        prob.writeLP("RouteContructionRegion" + str(region) + ".lp")
-
-        # The problem is solved using PuLP's choice of Solver to get 50 different optimal solutions
-        for i in range(50):
-            prob.solve()
-
-            if LpStatus[prob.status] == "Optimal": 
-                # Determine the cardinality of the set of decision variables  
-                p = 0
-                for v in prob.variables():
-                    if v.varValue == 1: 
-                        p = p + 1 
-
-                # For current set of nodes, find the heuristic solution to the most optimal path 
-                # Using cheapest insertion 
-                nodes = [i for i in smCurrentRegion if smVars[i].varValue == 1]
-                finalTour, finalTourWeight = CheapestInsertion(nodes, weights, centralNode = 'Warehouse')
-                # Add time it takes to unload per supermarket
-                finalTourWeight += 300*(len(finalTour)-2)
-
-                # If the route takes less than four hours to traverse then append to list of optimal solutions 
-                if finalTourWeight < 14400:
-                    routes.append(finalTour)
-                    costs.append(finalTourWeight)
-
-                # The constraint is added that the same solution cannot be returned again
-                prob += lpSum([1 * smVars[i] if smVars[i].varValue == 1 else 0 * smVars[i] for i in smCurrentRegion]) <= p - 1
-            # If a new optimal solution cannot be found, we end the program
-            else:
-                break
-
-    # Put routes and costs into a dataframe 
-    routesdf = pd.Series(routes)
-    costsdf = pd.Series(costs)
-    routeData = pd.DataFrame({'Route': routesdf, 'Cost': costsdf})
-
-    return routeData, list(locationData["Supermarket"])
-
-
-def RouteConstruction2(locationData, weights, l, demandPreds, weekday, min):
+def RouteConstruction2(locationData, weights, l, demandPreds, weekday, min, limit = 50, solver = None, workers = 1):
     '''
     Construct routes per region by creating supermarket node sets that satisfy the
     requirments and constraints
@@ -270,7 +680,7 @@ def RouteConstruction2(locationData, weights, l, demandPreds, weekday, min):
     locationData : pandas dataframe
     Basically dataframe of excel data
 
-    weights : pd.dataframe
+    weights : pd.dataframe/TravelTimeMatrix
     Distance, time, or any unit of measurement between nodes
 
     l : np.array
@@ -282,6 +692,18 @@ def RouteConstruction2(locationData, weights, l, demandPreds, weekday, min):
     weekday : string 
     The day of the week to generate routes for 
 
+    min : float
+    Minimum total demand (pallets) of a route
+
+    limit : integer
+    Maximum number of node sets per region
+
+    solver : string
+    None (default) to enumerate node sets directly, "highs"/"pulp" for the legacy re-solved LP
+
+    workers : integer
+    Number of processes to fan the regions out to (see RoutePool)
+
     Returns:
     -------
     routeData : pd.DataFrame
@@ -294,89 +716,103 @@ def RouteConstruction2(locationData, weights, l, demandPreds, weekday, min):
 
     Notes:
     ------
-    This method will work by repeatedly ban the optimal solution and resolve for more optimal routes. 
+    Node sets come smallest first, i.e. the order you get by repeatedly banning the optimal
+    solution of the minimum cardinality LP and resolving.
     '''
-    # Get supermarket regions
-    # locationData, l = KRegionalClusters(k=3, plot=True)
-    # locationData = locationData[1:][:]
-    
+    return RoutePool(locationData, weights, l, demandPreds, weekday, [(min, False)], limit, solver, workers)
+
+# Travel times of a RoutePool worker process, set once by _InitRegionWorker
+_workerWeights = None
+
+def _InitRegionWorker(weights):
+    global _workerWeights
+    if isinstance(weights, tuple):
+        weights = TravelTimeMatrix.attach(weights)
+    _workerWeights = weights
+
+def _RegionWorker(task, weights = None):
+    stores, demand, passes, limit, solver, name, capacity, maxTime, improve = task
+    if weights is None:
+        weights = _workerWeights
+    # Tour cache lookups of this region, so RoutePool can add up the counts of its worker processes
+    hits, misses = tourCache.hits, tourCache.misses
+    results = [RegionRouteConstruction(stores, demand, weights, minDemand, maximise, limit, solver, name, capacity, maxTime, improve)
+               for minDemand, maximise in passes]
+    return results, tourCache.hits - hits, tourCache.misses - misses
+
+def RoutePool(locationData, weights, l, demandPreds, weekday, passes = None, limit = 50, solver = None, workers = 1,
+              capacity = 12, maxTime = 14400, improve = True):
+    '''
+    Generate the full route pool for a day in a single pass, regional demand is looked up
+    once and shared by every RouteConstruction/RouteConstruction2 style pass
+
+    Inputs
+    ------
+    locationData, weights, l, demandPreds, weekday
+    As for RouteConstruction
+
+    passes : list
+    (minDemand, maximise) pairs, one per pass. Default is the RouteGenUsingKCI sweep:
+    RouteConstruction followed by RouteConstruction2 with min = 1..11
+
+    limit, solver
+    As for RouteConstruction
+
+    workers : integer
+    Number of processes to fan the regions out to. A TravelTimeMatrix is shared with the
+    workers read only through shared memory, a dataframe is copied once per worker. The
+    tours are then cached in the workers, their hits and misses are added to tourCache.
+
+    capacity, maxTime, improve
+    As for RegionRouteConstruction
+
+    Returns:
+    -------
+    routeData : pd.DataFrame
+        dataframe containing the all the routes and their corresponding cost, in the same
+        order as concatenating the routeData of each pass (whatever the number of workers)
+    '''
+    if passes is None:
+        passes = [(None, True)] + [(i, False) for i in range(1, 12)]
+
+    # Get supermarkets and their demand in each region
+    registry = StoreRegistry(locationData, demandPreds)
+    tasks = []
+    for region in set(l):
+        smCurrentRegion = locationData[l==region]["Supermarket"].tolist()
+        Demand = RegionDemand(locationData, smCurrentRegion, demandPreds, weekday, registry)
+        tasks.append((smCurrentRegion, Demand, passes, limit, solver, "RouteContructionRegion" + str(region), capacity, maxTime, improve))
+
+    # Regions are independent, each one runs every pass and gives back a (routes, costs) pair per pass
+    with tracer.stage("routePool", weekday = weekday, regions = len(tasks), passes = len(passes), workers = workers):
+        if workers > 1 and len(tasks) > 1:
+            owner = isinstance(weights, TravelTimeMatrix) and not weights.shared
+            shared = weights.share() if isinstance(weights, TravelTimeMatrix) else weights
+            try:
+                with ProcessPoolExecutor(max_workers = min(workers, len(tasks)), initializer = _InitRegionWorker, initargs = (shared,)) as pool:
+                    results = []
+                    for regionResults, hits, misses in pool.map(_RegionWorker, tasks):
+                        results.append(regionResults)
+                        tourCache.hits += hits
+                        tourCache.misses += misses
+            finally:
+                if owner:
+                    weights.close(unlink = True)
+        else:
+            results = [_RegionWorker(task, weights)[0] for task in tasks]
+
+    # Merge pass by pass, then region by region
     routes = []
     costs = []
-    # Loop through each region, identify possible locations, construct a set of feasible routes
-    for region in set(l):
-        
-        # Get supermarkets in current region and store in numpy array
-        smCurrentRegion = locationData[l==region]["Supermarket"]
-
-        # Construct supermarket data: demand and cost
-
-        # Helper function returns the value of demand for current store and weekday
-        def GetDemand(store):
-            store_type = locationData.loc[locationData["Supermarket"] == store, ["Type"]].values[0][0]
-            demandcol = demandPreds.loc[demandPreds["Supermarket Type"] == store_type]
-            return demandcol.loc[demandcol["Weekday"] == weekday, ["Demand"]].values[0]
-
-        Demand = []
-
-        for store in smCurrentRegion:
-            Demand.append(GetDemand(store))
-
-        # Generate demand data required for the supermarkets in the current region 
-        Demand = pd.Series(Demand, index = smCurrentRegion)
-
-        Cost = pd.Series([1]*len(smCurrentRegion), index = smCurrentRegion)
-
-        # Form integer binary LP to figure out a supermarket "node" set that
-        # satisfies the demand constraint. Will be used for constructing
-        # routes (and its cost)
-        prob = LpProblem("RouteContructionRegion" + str(region), LpMinimize)
-
-        # Create binary variables
-        smVars = LpVariable.dicts("sm", smCurrentRegion, 0, cat = "Binary")
-
-        # Maximise the total number of supermarket in the route
-        prob += lpSum([Cost[i] * smVars[i] for i in smCurrentRegion]), "Total Supermarkets in Route"
-
-        # Ensure route capacity is met
-        prob += lpSum([Demand[i] * smVars[i] for i in smCurrentRegion]) <= 12, "MaxTruckCapacity"
-        prob += lpSum([Demand[i] * smVars[i] for i in smCurrentRegion]) >= min, "MinTruckCapacity"
-
-        # The problem data is written to an .lp file
-        prob.writeLP("RouteContructionRegion" + str(region) + ".lp")
-
-        # The problem is solved using PuLP's choice of Solver to generate 50 different optimal solutions
-        for i in range(50):
-            prob.solve()
-
-            if LpStatus[prob.status] == "Optimal": 
-                # Determine the cardinality of the decision variables 
-                p = 0
-                for v in prob.variables():
-                    if v.varValue == 1: 
-                        p = p + 1 
-
-                # For current set of nodes, find the heuristic solution to the most optimal path 
-                # Using cheapest insertion 
-                nodes = [i for i in smCurrentRegion if smVars[i].varValue == 1]
-                finalTour, finalTourWeight = CheapestInsertion(nodes, weights, centralNode = 'Warehouse')
-                # Add time it takes to unload per supermarket 
-                finalTourWeight += 300*(len(finalTour)-2)
-                
-                # If the route takes less than four hours to traverse then append to list of optimal solutions 
-                if finalTourWeight < 14400:
-                    routes.append(finalTour)
-                    costs.append(finalTourWeight)
-
-                # The constraint is added that the same solution cannot be returned again
-                prob += lpSum([1 * smVars[i] if smVars[i].varValue == 1 else 0 * smVars[i] for i in smCurrentRegion]) <= p - 1
-            
-            # If a new optimal solution cannot be found, we end the program
-            else:
-                break
-    
+    for p in range(len(passes)):
+        for regionResults in results:
+            regionRoutes, regionCosts = regionResults[p]
+            routes += regionRoutes
+            costs += regionCosts
+
     # Put routes and costs into a dataframe 
     routesdf = pd.Series(routes)
     costsdf = pd.Series(costs)
     routeData = pd.DataFrame({'Route': routesdf, 'Cost': costsdf})
 
-    return routeData, list(locationData["Supermarket"])
\ No newline at end of file
+    return routeData, list(locationData["Supermarket"])
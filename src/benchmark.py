@@ -0,0 +1,291 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from os import sep
+import numpy as np
+import pandas as pd
+from stores import ReadLocations, StoreRegistry
+from traveltimes import TravelTimeMatrix
+
+# Where RunBenchmarks writes its results by default
+benchmarkDir = "Data" + sep + "Benchmarks"
+
+def Measure(function, *args, repeat = 3, memory = True, **kwargs):
+    '''
+    Time function(*args, **kwargs) and measure its peak memory
+
+    Inputs
+    ------
+    repeat : integer
+    Number of timed calls, the fastest is reported
+
+    memory : boolean
+    True for one extra call under tracemalloc to get the peak python allocation (tracemalloc
+    slows the call down so it is never part of the timing)
+
+    Returns
+    -------
+    result
+        return value of the last call
+    measurement : dict
+        seconds (fastest call), times (every call) and peakMemory (bytes, None if not measured)
+    '''
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, {"seconds": min(times), "times": times, "peakMemory": peak}
+
+def AucklandInstance():
+    '''
+    The bundled Auckland data (FoodstuffLocations.csv, FoodstuffTravelTimes.csv, demandModel.csv
+    and the cleaned demandData.csv)
+
+    Returns
+    -------
+    instance : dict
+        name, locationData (warehouse included), timeData, demandPreds and demandData
+    '''
+    from DataAnalysis import clean_data
+
+    demandData = clean_data(pd.read_csv("Data" + sep + "demandData.csv"), ReadLocations(fixTypes = False))
+    return {"name": "auckland",
+            "locationData": ReadLocations(),
+            "timeData": TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv"),
+            "demandPreds": pd.read_csv("Data" + sep + "demandModel.csv"),
+            "demandData": demandData}
+
+def SyntheticInstance(stores = 100, centres = 1, seed = 0):
+    '''
+    Generated network of stores around the warehouse (see instances.GenerateInstance), for seeing
+    how the model scales
+
+    Returns
+    -------
+    instance : dict
+        same keys as AucklandInstance
+    '''
+    from DataAnalysis import clean_data
+    from instances import GenerateInstance
+
+    instance = GenerateInstance(stores, centres, seed)
+    instance["demandData"] = clean_data(instance["demandData"], instance["locationData"])
+    return instance
+
+def Covered(routes, supermarkets):
+    '''
+    Number of supermarkets visited by at least one of the routes
+    '''
+    visited = set(store for route in routes for store in route)
+    return sum(store in visited for store in supermarkets)
+
+def BenchmarkInstance(instance, day = "Monday", k = None, limit = 50, insertions = 200, scenarios = 1000, repeat = 3, memory = True,
+                      seed = 0):
+    '''
+    Benchmark every stage of the model on one instance
+
+    Inputs
+    ------
+    instance : dict
+    From AucklandInstance or SyntheticInstance
+
+    day : string
+    Day to generate, select and simulate routes for
+
+    k : integer
+    Number of k means regions, one per 20 stores if None
+
+    limit : integer
+    Maximum number of node sets per region (see RouteConstruction)
+
+    insertions : integer
+    Number of random store sets CheapestInsertion is timed on
+
+    scenarios : integer
+    Number of scenarios given to bootstrap and simulate
+
+    repeat, memory
+    As for Measure
+
+    seed : integer
+    Seed of the k means regions, the CheapestInsertion store sets and the simulation
+
+    Returns
+    -------
+    results : list
+        one dict per benchmark with instance, benchmark, seconds, times, peakMemory and quality
+    '''
+    from RouteGenKCI import KRegionalClusters, CheapestInsertion, RouteConstruction, RouteConstruction2, RoutePool, tourCache
+    from routepool import PruneRoutePool
+    from routeselectionV1 import RouteSelection
+    from routeselectionV2 import RouteSelectionV2
+    from simulation import setupbootstrap, bootstrap, simulate
+
+    allLocations = instance["locationData"]
+    locationData = allLocations[allLocations["Type"] != "Warehouse"].reset_index(drop = True)
+    supermarkets = list(locationData["Supermarket"])
+    timeData, demandPreds = instance["timeData"], instance["demandPreds"]
+    if k is None:
+        k = max(2, len(supermarkets)//20)
+    rng = np.random.default_rng(seed)
+    results = []
+
+    def Record(benchmark, measurement, **quality):
+        results.append({"instance": instance["name"], "benchmark": benchmark, "stores": len(supermarkets), **measurement,
+                        "quality": quality})
+        print(f"{instance['name']:>20} {benchmark:<20} {measurement['seconds']:10.4f}s", quality)
+
+    # Clustering
+    l, measurement = Measure(KRegionalClusters, locationData, k = k, seed = seed, repeat = repeat, memory = memory)
+    Record("KRegionalClusters", measurement, regions = len(set(l)))
+
+    # Cheapest insertion on random store sets of 2 to 6 stores (uncached)
+    nodeSets = [list(rng.choice(supermarkets, size = rng.integers(2, 7), replace = False)) for i in range(insertions)]
+    tours, measurement = Measure(lambda: [CheapestInsertion(nodes, timeData, centralNode = "Warehouse") for nodes in nodeSets],
+                                 repeat = repeat, memory = memory)
+    Record("CheapestInsertion", measurement, tours = len(tours), meanWeight = float(np.mean([w for tour, w in tours])))
+
+    # Route construction, the tour cache is emptied before every call so each one does the full work
+    def Construct(construction, *args):
+        tourCache.clear()
+        return construction(locationData, timeData, l, demandPreds, day, *args, limit = limit)[0]
+
+    for name, construction, args in [("RouteConstruction", RouteConstruction, ()), ("RouteConstruction2", RouteConstruction2, (6,)),
+                                     ("RoutePool", RoutePool, ())]:
+        routeData, measurement = Measure(Construct, construction, *args, repeat = repeat, memory = memory)
+        Record(name, measurement, routes = len(routeData), covered = Covered(routeData["Route"], supermarkets),
+               meanCost = float(routeData["Cost"].mean()) if len(routeData) else None)
+
+    # Route selection over the pruned pool
+    routeData, report = PruneRoutePool(routeData)
+    selected = None
+    for name, selection in [("RouteSelectionV1", RouteSelection), ("RouteSelectionV2", RouteSelectionV2)]:
+        (routes, obj), measurement = Measure(selection, routeData, supermarkets, repeat = repeat, memory = memory)
+        chosen = routes.loc[routes["State"] == 1]
+        Record(name, measurement, objective = obj, routes = len(chosen), covered = Covered(chosen["Route"], supermarkets))
+        if name == "RouteSelectionV2":
+            selected = chosen[["Route", "Cost"]].reset_index(drop = True)
+
+    # Simulation of the selected routes
+    if instance.get("demandData") is None or selected is None or len(selected) == 0:
+        return results
+    wknd = day == "Saturday"
+    samples, measurement = Measure(setupbootstrap, instance["demandData"], wknd = wknd, repeat = repeat, memory = memory)
+    Record("setupbootstrap", measurement, samples = sum(len(s) for s in samples))
+
+    random.seed(seed)
+    demands, measurement = Measure(lambda: [bootstrap(*samples) for i in range(scenarios)], repeat = repeat, memory = memory)
+    Record("bootstrap", measurement, scenarios = scenarios)
+
+    random.seed(seed)
+    registry = StoreRegistry(allLocations)
+    costs, measurement = Measure(lambda: [simulate(selected, registry, *samples, wknd = wknd) for i in range(scenarios)],
+                                 repeat = repeat, memory = memory)
+    Record("simulate", measurement, scenarios = scenarios, meanCost = float(np.mean(costs)))
+    return results
+
+def MachineInfo():
+    '''
+    What the results depend on besides the code: python/numpy/pandas versions, cpu and git commit
+    '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(), "commit": commit}
+
+def RunBenchmarks(instances = None, output = None, **kwargs):
+    '''
+    Benchmark each instance and save the results as json
+
+    Inputs
+    ------
+    instances : list
+    Instances (AucklandInstance/SyntheticInstance), the Auckland data and 100 and 200 store
+    synthetic networks if None
+
+    output : string
+    json file to write, Data/Benchmarks/benchmark-<time>.json if None
+
+    kwargs
+    Passed on to BenchmarkInstance
+
+    Returns
+    -------
+    run : dict
+        created, machine and results (see BenchmarkInstance)
+    '''
+    if instances is None:
+        instances = [AucklandInstance(), SyntheticInstance(100), SyntheticInstance(200)]
+    created = time.strftime("%Y-%m-%dT%H:%M:%S")
+    run = {"created": created, "machine": MachineInfo(), "settings": kwargs, "results": []}
+    for instance in instances:
+        run["results"] += BenchmarkInstance(instance, **kwargs)
+
+    if output is None:
+        output = os.path.join(benchmarkDir, "benchmark-" + created.replace(":", "") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok = True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent = 1, default = float)
+    print("Benchmark results saved to", output)
+    return run
+
+def CompareBenchmarks(baseline, current, tolerance = 0.25):
+    '''
+    Regressions of a benchmark run against a baseline run
+
+    Inputs
+    ------
+    baseline, current : dict/string
+    Runs from RunBenchmarks or the json files they were saved to
+
+    tolerance : float
+    Relative slow down (or objective increase) allowed before a benchmark counts as a regression
+
+    Returns
+    -------
+    comparison : pd.DataFrame
+        instance, benchmark, baseline and current seconds, their ratio and regression, one row
+        per benchmark in both runs. The objective of the selections is compared too.
+    '''
+    runs = []
+    for run in (baseline, current):
+        if isinstance(run, str):
+            with open(run) as f:
+                run = json.load(f)
+        runs.append({(r["instance"], r["benchmark"]): r for r in run["results"]})
+
+    rows = []
+    for key in runs[1]:
+        if key not in runs[0]:
+            continue
+        old, new = runs[0][key], runs[1][key]
+        ratio = new["seconds"]/old["seconds"] if old["seconds"] > 0 else np.inf
+        oldObj, newObj = old["quality"].get("objective"), new["quality"].get("objective")
+        worse = oldObj is not None and newObj is not None and newObj > oldObj*(1 + tolerance)
+        rows.append({"instance": key[0], "benchmark": key[1], "baseline": old["seconds"], "current": new["seconds"],
+                     "ratio": ratio, "regression": bool(ratio > 1 + tolerance or worse)})
+    return pd.DataFrame(rows, columns = ["instance", "benchmark", "baseline", "current", "ratio", "regression"])
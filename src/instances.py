@@ -0,0 +1,175 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import datetime
+import os
+from os import sep
+import numpy as np
+import pandas as pd
+from stores import ReadLocations, storeTypes
+from traveltimes import TravelTimeMatrix
+
+# File names of an instance, the same as the bundled data so the model reads either
+locationsName = "FoodstuffLocations.csv"
+travelTimesName = "FoodstuffTravelTimes.csv"
+demandModelName = "demandModel.csv"
+demandDataName = "demandData.csv"
+
+# Radius of the earth (km)
+earthRadius = 6371.0
+
+def Haversine(long1, lat1, long2, lat2):
+    '''
+    Great circle distance (km) between points given in degrees, broadcasting like numpy
+    '''
+    long1, lat1, long2, lat2 = map(np.radians, (long1, lat1, long2, lat2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((long2 - long1)/2)**2
+    return 2*earthRadius*np.arcsin(np.sqrt(a))
+
+def TravelTimes(coords, urbanSpeed = 15, motorwaySpeed = 50, scale = 20, overhead = 120, noise = 0.2, rng = None):
+    '''
+    Travel time matrix from straight line distances and a speed model
+
+    Inputs
+    ------
+    coords : np.array
+    (stores x 2) Long, Lat of each store
+
+    urbanSpeed, motorwaySpeed : float
+    Average speed (km/h, straight line) of very short and very long trips, the speed of a trip
+    of d km is motorwaySpeed - (motorwaySpeed - urbanSpeed)*exp(-d/scale)
+
+    scale : float
+    Distance (km) over which trips move from urban to motorway speed
+
+    overhead : float
+    Seconds added to every trip (leaving the yard, parking)
+
+    noise : float
+    Standard deviation of the log normal factor each trip is multiplied by, drawn separately
+    for i -> j and j -> i so the matrix is asymmetric like the real one
+
+    rng : np.random.Generator
+
+    Returns
+    -------
+    W : np.ndarray
+        W[i, j] is the travel time (s) from store i to store j, see TravelTimeMatrix
+
+    Notes:
+    ------
+    With the defaults the travel times of the bundled stores come out within a few percent of
+    FoodstuffTravelTimes.csv on average, and noise matches the spread of the ratio between them.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    long, lat = coords[:, 0], coords[:, 1]
+    distance = Haversine(long[:, None], lat[:, None], long[None, :], lat[None, :])
+    speed = motorwaySpeed - (motorwaySpeed - urbanSpeed)*np.exp(-distance/scale)
+    W = (overhead + distance/speed*3600)*rng.lognormal(0, noise, size = distance.shape)
+    np.fill_diagonal(W, 0)
+    return np.round(W, 2)
+
+def GenerateInstance(stores = 500, centres = 1, seed = 0, spread = 8, centreSpread = 25, centre = (174.7281051, -36.9079041),
+                     locationData = None, demandPreds = None, weeks = 4, **speedModel):
+    '''
+    Random supermarket network in the same schema as the bundled data, for scaling tests
+
+    Inputs
+    ------
+    stores : integer
+    Number of supermarkets (the warehouse is extra)
+
+    centres : integer
+    Number of population centres the stores cluster around, the warehouse sits at the first
+    one and the others are placed up to centreSpread km away
+
+    seed : integer
+    Seed of the instance, the same seed always gives the same instance
+
+    spread : float
+    Standard deviation (km) of the stores around their centre
+
+    centreSpread : float
+    Standard deviation (km) of the other centres around the first
+
+    centre : tuple
+    Long, Lat of the warehouse, the Auckland warehouse by default
+
+    locationData : pd.DataFrame
+    Locations whose mix of store types is copied, ReadLocations() if None
+
+    demandPreds : pd.DataFrame
+    Fitted demand model (demandModel.csv) every store's demand is drawn from, read from Data if None
+
+    weeks : integer
+    Weeks of daily demand history to draw, starting on Monday 1/07/19 like demandData.csv
+
+    speedModel
+    Keyword arguments of TravelTimes
+
+    Returns
+    -------
+    instance : dict
+        name, locationData (warehouse included), timeData (TravelTimeMatrix), demandPreds
+        and demandData (wide, same layout as demandData.csv)
+    '''
+    rng = np.random.default_rng(seed)
+    if locationData is None:
+        locationData = ReadLocations()
+    if demandPreds is None:
+        demandPreds = pd.read_csv("Data" + sep + demandModelName)
+
+    # Store types in the proportions of the real network
+    mix = locationData.loc[locationData["Type"].isin(storeTypes), "Type"].value_counts(normalize = True)
+    types = rng.choice(mix.index.to_numpy(), size = stores, p = mix.to_numpy())
+    names = ["Warehouse"] + [f"{storeType} {i + 1}" for i, storeType in enumerate(types)]
+
+    # Clustered coordinates (km from the warehouse), turned into degrees around centre
+    offsets = np.vstack([[0.0, 0.0], rng.normal(0, centreSpread, size = (centres - 1, 2))])
+    cluster = rng.integers(centres, size = stores)
+    km = np.vstack([[0.0, 0.0], offsets[cluster] + rng.normal(0, spread, size = (stores, 2))])
+    kmPerDegree = np.pi*earthRadius/180
+    coords = np.c_[centre[0] + km[:, 0]/(kmPerDegree*np.cos(np.radians(centre[1]))), centre[1] + km[:, 1]/kmPerDegree]
+    name = f"synthetic{stores}-{centres}-{seed}"
+    instanceLocations = pd.DataFrame({"Type": ["Warehouse"] + list(types), "Supermarket": names,
+                                      "Long": coords[:, 0], "Lat": coords[:, 1]})
+    timeData = TravelTimeMatrix(TravelTimes(coords, rng = rng, **speedModel), names, name)
+
+    # Daily demand of every store, Poisson around the fitted demand of its type and weekday (none on Sundays)
+    fitted = {(t, d): value for t, d, value in zip(demandPreds["Supermarket Type"], demandPreds["Weekday"], demandPreds["Demand"])}
+    days = [datetime.date(2019, 7, 1) + datetime.timedelta(days = i) for i in range(7*weeks)]
+    mean = np.array([[fitted.get((t, day.strftime("%A")), 0) for day in days] for t in types], dtype = float)
+    demandData = pd.DataFrame(rng.poisson(mean), columns = [f"{day.day}/{day.month:02d}/{day:%y}" for day in days])
+    demandData.insert(0, "Supermarket", names[1:])
+
+    return {"name": name, "locationData": instanceLocations, "timeData": timeData,
+            "demandPreds": demandPreds.copy(), "demandData": demandData}
+
+def WriteInstance(instance, directory):
+    '''
+    Write an instance as FoodstuffLocations.csv, FoodstuffTravelTimes.csv, demandModel.csv and
+    demandData.csv in directory, so anything reading the Data directory can read it instead
+
+    Returns
+    -------
+    directory : string
+    '''
+    os.makedirs(directory, exist_ok = True)
+    instance["locationData"].to_csv(os.path.join(directory, locationsName), index = False)
+    instance["timeData"].to_frame().to_csv(os.path.join(directory, travelTimesName), float_format = "%.2f")
+    instance["demandPreds"].to_csv(os.path.join(directory, demandModelName), index = False)
+    instance["demandData"].to_csv(os.path.join(directory, demandDataName), index = False)
+    return directory
+
+def ReadInstance(directory, name = None):
+    '''
+    Read an instance written by WriteInstance (or the bundled Data directory)
+    '''
+    return {"name": name or os.path.basename(os.path.normpath(directory)),
+            "locationData": ReadLocations(os.path.join(directory, locationsName)),
+            "timeData": TravelTimeMatrix.from_csv(os.path.join(directory, travelTimesName)),
+            "demandPreds": pd.read_csv(os.path.join(directory, demandModelName)),
+            "demandData": pd.read_csv(os.path.join(directory, demandDataName))}
@@ -0,0 +1,230 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import atexit
+import json
+import os
+import sys
+import time
+
+# Setting this environment variable to a file name traces the whole run to that file,
+# e.g. FOODSTUFFS_TRACE=trace.json python main.py generate (see Tracer.start for the options)
+traceVariable = "FOODSTUFFS_TRACE"
+
+class _Stage:
+    '''
+    Context manager timing one stage, see Tracer.stage
+    '''
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.parent = self.tracer._stack[-1] if self.tracer._stack else None
+        self.tracer._stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.tracer._stack.pop()
+        self.tracer.spans.append({"name": self.name, "parent": self.parent, "attrs": self.attrs,
+                                  "start": self.start - self.tracer._start, "seconds": seconds})
+        return False
+
+class _Timer:
+    '''
+    Context manager adding its time to the <name>.calls and <name>.seconds counters, see Tracer.timer
+    '''
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.count(self.name + ".calls")
+        self.tracer.count(self.name + ".seconds", time.perf_counter() - self.start)
+        return False
+
+class _NoStage:
+    '''
+    Stand-in for _Stage/_Timer while tracing is off, so instrumented code costs one attribute check
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_noStage = _NoStage()
+
+class Tracer:
+    '''
+    Collects stage timings, counters and events of a run and writes them as a json trace
+
+    Attributes
+    ----------
+    enabled : boolean
+    True between start and stop, everything else is a no-op while False
+
+    spans : list
+    One dict per finished stage: name, parent stage, attrs, start and seconds (from start)
+
+    counters : dict
+    Name -> running total, e.g. solver.calls and solver.seconds
+
+    events : list
+    One dict per event: name, time and its values, e.g. the size of each LP
+
+    Notes:
+    ------
+    Only the process that started the tracer is traced. Work fanned out to worker processes
+    (RoutePool, simulate_parallel, GenerateWeek with workers > 1) shows up as the stage that
+    waited for it.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.spans = []
+        self.counters = {}
+        self.events = []
+        self._stack = []
+        self._start = time.perf_counter()
+
+    def stage(self, name, **attrs):
+        '''
+        Context manager timing a stage, e.g. with tracer.stage("region", region = 3): ...
+        '''
+        return _Stage(self, name, attrs) if self.enabled else _noStage
+
+    def timer(self, name):
+        '''
+        Context manager for code run too often for a span each (e.g. every CheapestInsertion),
+        only the number of calls and the total seconds are kept
+        '''
+        return _Timer(self, name) if self.enabled else _noStage
+
+    def count(self, name, value = 1):
+        '''
+        Add value to a counter
+        '''
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def event(self, name, **values):
+        '''
+        Record a named set of values, e.g. tracer.event("lp", rows = 47, cols = 1200)
+        '''
+        if self.enabled:
+            self.events.append({"name": name, "time": time.perf_counter() - self._start, **values})
+
+    def start(self, path = None, profile = False, memory = False):
+        '''
+        Start tracing
+
+        Inputs
+        ------
+        path : string
+        json file the trace is written to by stop (and at exit if stop is never called), None to
+        only return it
+
+        profile : boolean
+        True to also run cProfile, the top functions go in the trace and the full profile in
+        <path>.prof (for pstats/snakeviz)
+
+        memory : boolean
+        True to also run tracemalloc, the peak and the top allocating lines go in the trace
+        '''
+        self.reset()
+        self.path = path
+        self.profiler = None
+        self.memory = memory
+        self.enabled = True
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stages(self):
+        '''
+        Calls and total seconds of each stage name
+        '''
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault(span["name"], {"calls": 0, "seconds": 0.0})
+            total["calls"] += 1
+            total["seconds"] += span["seconds"]
+        return totals
+
+    def stop(self, top = 30):
+        '''
+        Stop tracing and write the trace to path (if one was given to start)
+
+        Inputs
+        ------
+        top : integer
+        Number of functions/allocating lines kept from the profile and memory snapshot
+
+        Returns
+        -------
+        trace : dict
+            argv, seconds, stages (totals), spans, counters, events and, when asked for, profile and memory
+        '''
+        if not self.enabled:
+            return None
+        trace = {"argv": sys.argv, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "seconds": time.perf_counter() - self._start}
+
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            stats = pstats.Stats(self.profiler)
+            if self.path:
+                stats.dump_stats(self.path + ".prof")
+            rows = sorted(stats.stats.items(), key = lambda item: item[1][3], reverse = True)[:top]
+            trace["profile"] = [{"function": f"{file}:{line}({function})", "calls": calls, "totalSeconds": tottime,
+                                 "cumulativeSeconds": cumtime}
+                                for (file, line, function), (primitive, calls, tottime, cumtime, callers) in rows]
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            trace["memory"] = {"current": current, "peak": peak,
+                               "top": [{"line": str(stat.traceback), "size": stat.size, "count": stat.count}
+                                       for stat in snapshot.statistics("lineno")[:top]]}
+
+        self.enabled = False
+        trace.update({"stages": self.stages(), "counters": self.counters, "events": self.events, "spans": self.spans})
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump(trace, f, indent = 1, default = str)
+            print("Trace written to", self.path)
+        return trace
+
+# The process wide tracer every instrumented module reports to
+tracer = Tracer()
+
+def StartFromEnvironment():
+    '''
+    Start tracing to $FOODSTUFFS_TRACE if it is set, FOODSTUFFS_PROFILE=1 and FOODSTUFFS_MEMORY=1
+    add cProfile and tracemalloc. The trace is written at exit.
+    '''
+    path = os.environ.get(traceVariable)
+    if path and not tracer.enabled:
+        tracer.start(path, profile = os.environ.get("FOODSTUFFS_PROFILE") == "1", memory = os.environ.get("FOODSTUFFS_MEMORY") == "1")
+        atexit.register(tracer.stop)
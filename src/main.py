@@ -3,25 +3,18 @@
 # Import Python Core modules
 #
 ####################################################################################
-from ast import literal_eval
-from scipy import stats
-import matplotlib.pyplot as plt
-import statsmodels.stats.weightstats as sms
-import statistics
-import seaborn as sns
+import argparse
+import numpy as np
+import pandas as pd
+from os import sep
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
 ####################################################################################
 #
-# Import FoodStuffs Model modules
+# FoodStuffs Model modules are imported inside the functions that use them so each
+# command only pays for what it needs (the plotting and statistics stack is slow to import)
 #
 ####################################################################################
-from DataAnalysis import *
-from RouteGenKCI import *
-from visualisations import *
-from RouteGen import *
-from routeselectionV1 import *
-from routeselectionV2 import *
-from routegenAlex import *
-from simulation import *
 '''
 ####################################################################################
 #
@@ -29,34 +22,142 @@ from simulation import *
 #
 ####################################################################################
 '''
-def main():
+def main(argv = None):
     '''
-    Uncomment the function you would like to run :D
+    Command line entry point, run "python main.py -h" for the commands. Each command only
+    imports the modules it needs.
+    '''
+    days = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday")
+    parser = argparse.ArgumentParser(description = "Foodstuffs truck scheduling")
+    parser.add_argument("--trace", metavar = "PATH", default = None,
+                        help = "write a json trace of stage timings, solver calls and LP sizes (or set $FOODSTUFFS_TRACE)")
+    parser.add_argument("--profile", action = "store_true", help = "add the top cProfile functions to the trace, full profile in PATH.prof")
+    parser.add_argument("--trace-memory", action = "store_true", help = "add the tracemalloc peak and top allocations to the trace")
+    commands = parser.add_subparsers(dest = "command", metavar = "command")
+
+    commands.add_parser("analyse", help = "fit the demand model and write Data/demandModel.csv")
+
+    generate = commands.add_parser("generate", help = "generate and select the optimal routes for a day")
+    generate.add_argument("--day", default = "Monday", choices = days)
+    generate.add_argument("--workers", type = int, default = 1, help = "processes for route construction (not with --cg)")
+    generate.add_argument("--cg", action = "store_true", help = "select routes by column generation")
+    generate.add_argument("--no-improve", action = "store_true", help = "skip the 2-opt/Or-opt improvement of the tours")
+
+    select = commands.add_parser("select", help = "select the optimal routes from a saved route pool")
+    select.add_argument("--day", default = "Monday", choices = days)
+
+    simulate = commands.add_parser("simulate", help = "monte carlo simulation of the optimal routes")
+    simulate.add_argument("--weekday", default = "Monday", choices = days)
+    simulate.add_argument("--weekend", default = "Saturday", choices = days)
+    simulate.add_argument("--half-width", type = float, default = 10, help = "target 95%% CI half width ($)")
+    simulate.add_argument("--seed", type = int, default = None)
+    simulate.add_argument("--sampling", default = "iid", choices = ["iid", "antithetic", "lhs", "sobol"])
+
+    visualise = commands.add_parser("visualise", help = "draw the optimal routes of several days on one map")
+    visualise.add_argument("--days", nargs = "+", default = ["Monday", "Saturday"], choices = days)
+
+    week = commands.add_parser("week", help = "generate and select the optimal routes for several days concurrently")
+    week.add_argument("--days", nargs = "+", default = days, choices = days)
+    week.add_argument("--workers", type = int, default = None, help = "processes, one per day by default")
+
+    pipeline = commands.add_parser("pipeline", help = "generate -> select -> simulate (-> visualise), reusing cached stages")
+    pipeline.add_argument("--days", nargs = "+", default = days, choices = days)
+    pipeline.add_argument("--k", type = int, default = 2, help = "number of k means regions")
+    pipeline.add_argument("--seed", type = int, default = 0, help = "k means and tie breaking seed")
+    pipeline.add_argument("--trucks", type = int, default = 20)
+    pipeline.add_argument("--no-improve", action = "store_true", help = "skip the 2-opt/Or-opt improvement of the tours")
+    pipeline.add_argument("--sim-seed", type = int, default = 0)
+    pipeline.add_argument("--half-width", type = float, default = 10, help = "target 95%% CI half width ($)")
+    pipeline.add_argument("--sampling", default = "iid", choices = ["iid", "antithetic", "lhs", "sobol"])
+    pipeline.add_argument("--no-simulate", action = "store_true")
+    pipeline.add_argument("--visualise", action = "store_true")
+    pipeline.add_argument("--data", default = "Data", help = "directory of the input csvs, e.g. a generated instance")
+
+    stress = commands.add_parser("stress", help = "run the pipeline on generated networks of several sizes")
+    stress.add_argument("--stores", nargs = "+", type = int, default = [500, 1000])
+    stress.add_argument("--centres", type = int, default = 3, help = "population centres the stores cluster around")
+    stress.add_argument("--seed", type = int, default = 0)
+    stress.add_argument("--days", nargs = "+", default = ["Monday", "Saturday"], choices = days)
+    stress.add_argument("--simulate", action = "store_true")
+
+    benchmark = commands.add_parser("benchmark", help = "time route generation, selection and simulation, saving json results")
+    benchmark.add_argument("--stores", nargs = "*", type = int, default = [100, 200], help = "sizes of the generated networks")
+    benchmark.add_argument("--no-auckland", action = "store_true", help = "skip the bundled Auckland data")
+    benchmark.add_argument("--day", default = "Monday", choices = days)
+    benchmark.add_argument("--repeat", type = int, default = 3, help = "timed calls per benchmark, the fastest is reported")
+    benchmark.add_argument("--scenarios", type = int, default = 1000, help = "scenarios given to bootstrap and simulate")
+    benchmark.add_argument("--output", default = None, help = "json file, Data/Benchmarks/benchmark-<time>.json by default")
+    benchmark.add_argument("--baseline", default = None, help = "earlier json results to check for regressions")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    if args.command == "generate" and args.cg and args.workers > 1:
+        # Column generation prices routes one round at a time in this process
+        generate.error("--workers cannot be used with --cg")
+
+    from instrument import tracer, StartFromEnvironment
+    if args.trace is not None:
+        tracer.start(args.trace, profile = args.profile, memory = args.trace_memory)
+    else:
+        StartFromEnvironment()
+    try:
+        RunCommand(args)
+    finally:
+        tracer.stop()
+
+def RunCommand(args):
+    '''
+    Runs the command parsed by main
     '''
     print("Running functions ...\n")
-    # DataAnalysis()
-    #AlexRouteGeneration()
-    #AlexRouteSelection()
-    # Visualisations()
-    # RouteGenUsingKCI()
-    GenerateOptimalSolution(day = "Friday")
-    #RunSimulation()
-    # RunSimulation2()
+    if args.command == "analyse":
+        DataAnalysis()
+    elif args.command == "generate":
+        if args.cg:
+            GenerateOptimalSolutionCG(day = args.day, improve = not args.no_improve)
+        else:
+            GenerateOptimalSolution(day = args.day, workers = args.workers, improve = not args.no_improve)
+    elif args.command == "select":
+        SelectSavedRoutes(day = args.day)
+    elif args.command == "simulate":
+        RunSimulation(args.weekday, args.weekend, halfWidth = args.half_width, seed = args.seed, sampling = args.sampling)
+    elif args.command == "visualise":
+        Visualisations(days = args.days)
+    elif args.command == "week":
+        GenerateWeek(days = args.days, workers = args.workers)
+    elif args.command == "pipeline":
+        from pipeline import RunPipeline
+        simulateDays = (None, None) if args.no_simulate else ("Monday", "Saturday")
+        RunPipeline(args.days, *simulateDays, generate = {"k": args.k, "seed": args.seed, "improve": not args.no_improve}, select = {"trucks": args.trucks},
+                    simulate = {"halfWidth": args.half_width, "seed": args.sim_seed, "sampling": args.sampling},
+                    visualise = args.visualise, publish = args.data == "Data", data = args.data)
+    elif args.command == "stress":
+        from pipeline import StressTest
+        StressTest(args.stores, args.centres, args.seed, args.days, simulate = args.simulate)
+    elif args.command == "benchmark":
+        Benchmark(args.stores, not args.no_auckland, day = args.day, repeat = args.repeat, scenarios = args.scenarios,
+                  output = args.output, baseline = args.baseline)
     print("Done!")
 
 def DataAnalysis():
     '''
     Stuff
     '''
+    from statsmodels.formula.api import ols
+    from statsmodels.stats.anova import anova_lm
+    from statsmodels.graphics.factorplots import interaction_plot
+    from DataAnalysis import clean_data, assumption_plots, predict_demand_data
+    from stores import ReadLocations
+
     # Load data
     demandData = pd.read_csv("Data" + sep + "demandData.csv")
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    supermarkets = list(locationData["Supermarket"])
+    locationData = ReadLocations(fixTypes = False)
 
     #demandData = pd.read_csv() TODO finish this line
     # Clean data for analysis
     demandData = clean_data(demandData, locationData)
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
 
     # Visualise interaction profiles
     figure = interaction_plot(demandData["Weekday"], demandData["Type"], demandData["Demand"], ylabel="Demand")
@@ -82,13 +183,17 @@ def DataAnalysis():
     demandPreds.to_csv("Data" + sep + "demandModel.csv", index=False)
 
 def AlexRouteGeneration():
+    from RouteGenKCI import KRegionalClusters
+    from routegenAlex import RouteConstructionAlex
+    from stores import ReadLocations
+    from traveltimes import TravelTimeMatrix
+
         # Import data + clean up
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+    locationData = ReadLocations()
     locationData = locationData[1:][:] # Remove warehouse node
 
     # Import travel times between supermarkets + demand predictions per store
-    timeData = pd.read_csv("Data" + sep + "FoodstuffTravelTimes.csv", index_col = 0)
+    timeData = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv").to_frame()
     demandPreds = pd.read_csv("Data" + sep + "demandModel.csv")
 
     # Separate supermarkets into k regions
@@ -100,10 +205,12 @@ def AlexRouteGeneration():
     routeData.to_csv("Data" + sep + "AlexGeneratedRoutesTest.csv", index=False)
 
 def AlexRouteSelection():
+    from routeselectionV1 import RouteSelection
+    from stores import ReadLocations
+
     # Read data
     routeData = pd.read_csv("Data" + sep + "AlexGeneratedRoutesTest.csv")
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+    locationData = ReadLocations()
     # Delete warehouse node
     locationData.drop(locationData[locationData["Type"] == "Warehouse"].index, inplace = True)
     supermarkets = list(locationData["Supermarket"])
@@ -131,67 +238,89 @@ def AlexRouteSelection():
     print("DONE SELECTING")
     return
 
-def RouteGenUsingKCI(day = "Monday"):
+def LoadModelData():
     '''
-    Default solution is a weekday solution
-    Please call with day = "Saturday" for weekend solution
+    Loads the supermarket locations (warehouse removed), travel times and demand predictions
+
+    Returns
+    -------
+    locationData : pd.DataFrame
+    timeData : TravelTimeMatrix
+    demandPreds : pd.DataFrame
     '''
-    # Import data
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+    from stores import ReadLocations
+    from traveltimes import TravelTimeMatrix
+
+    locationData = ReadLocations()
     # Delete warehouse node
     locationData.drop(locationData[locationData["Type"] == "Warehouse"].index, inplace = True)
     # if (day == "Saturday"):
     #     locationData.drop(locationData[locationData["Type"] == "Four Square"].index, inplace = True)
-    timeData = pd.read_csv("Data" + sep + "FoodstuffTravelTimes.csv", index_col = 0)
+    timeData = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv")
     demandPreds = pd.read_csv("Data" + sep + "demandModel.csv")
+    return locationData, timeData, demandPreds
 
-    # Create k regions
-    l = KRegionalClusters(locationData, k=2, plot=False)
+def RouteGenUsingKCI(day = "Monday", workers = 1, data = None, l = None, improve = True):
+    '''
+    Default solution is a weekday solution
+    Please call with day = "Saturday" for weekend solution
+    improve = False keeps the plain cheapest insertion tours (no 2-opt/Or-opt)
+    Set workers > 1 to construct the routes of each region in parallel
+    data (from LoadModelData) and the k means regions l can be passed in to skip reloading/re-clustering
+    '''
+    from RouteGenKCI import KRegionalClusters, RoutePool, tourCache
+    from routepool import WriteRoutes
+
+    # Import data
+    if data is None:
+        data = LoadModelData()
+    locationData, timeData, demandPreds = data
 
-    # Generate routes
-    routeData1, stores = RouteConstruction(locationData, timeData, l, demandPreds, day)
-    frame = [routeData1]
-    for i in range(1,12):
-        routeData2, stores = RouteConstruction2(locationData, timeData, l, demandPreds, day, min = i)
-        frame.append(routeData2)
-    routeData = pd.concat(frame, ignore_index = True)
+    # Create k regions
+    if l is None:
+        l = KRegionalClusters(locationData, k=2, plot=False)
+
+    # Generate routes, RouteConstruction followed by RouteConstruction2 for min = 1..11
+    routeData, stores = RoutePool(locationData, timeData, l, demandPreds, day, workers = workers, improve = improve)
+    stats = tourCache.stats()
+    if workers > 1:
+        # The tours were cached in the worker processes, only their hits and misses come back
+        del stats["size"]
+    print("Tour cache:", stats)
     # Save routes to csv
-    routeData.to_csv("Data" + sep + "Routes" + sep + "generatedRoutes" + day + ".csv", index=False)
+    WriteRoutes(routeData, "Data" + sep + "Routes" + sep + "generatedRoutes" + day + ".csv")
+    return routeData
 
-def GenerateOptimalSolution(day = "Monday"):
+def SelectOptimalRoutes(routeData, supermarkets, day = "Monday"):
     '''
-    Default solution is a weekday solution
-    Please call with day = "Saturday" for weekend solution
+    Selects the optimal routes for day from the generated routes, saving them to csv if every supermarket is covered
     '''
-    # Regenerate routes first
-    RouteGenUsingKCI(day)
+    from routepool import PruneRoutePool
+    from routeselectionV2 import RouteSelectionV2
 
-    # Read data
-    routeData = pd.read_csv("Data" + sep + "Routes" + sep + "generatedRoutes" + day + ".csv", converters = {"Route": literal_eval})
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
-    # Delete warehouse node
-    locationData.drop(locationData[locationData["Type"] == "Warehouse"].index, inplace = True)
-    # if (day == "Saturday"):
-    #     locationData.drop(locationData[locationData["Type"] == "Four Square"].index, inplace = True)
-    supermarkets = list(locationData["Supermarket"])
+    # Drop duplicate routes over the same stores so the selection model is smaller
+    routeData, report = PruneRoutePool(routeData)
+    print("Route pool pruning:", report)
 
     # Route selection
     routes, obj = RouteSelectionV2(routeData, supermarkets)
+
+    return SaveOptimalRoutes(routes, supermarkets, day)
+
+def SaveOptimalRoutes(routes, supermarkets, day = "Monday"):
+    '''
+    Saves the selected routes to csv if they actually cover every supermarket
+    '''
+    from routepool import WriteRoutes
+
     optimalRoutes = routes.loc[routes['State'] == 1]
     save = True
 
     # Checking if solution acutally covers all supermarkets
     print("Commencing Debugging")
+    covered = set(s for route in optimalRoutes['Route'] for s in route)
     for s in supermarkets:
-        included = 0
-        i = 0
-        while i < len(optimalRoutes) and not included:
-            if s in optimalRoutes['Route'][i]:
-                included = 1
-            i+=1
-        if not included:
+        if s not in covered:
             save = False
             print(f"{s} is not in any routes!")
     print("Finished Debugging\n")
@@ -199,115 +328,233 @@ def GenerateOptimalSolution(day = "Monday"):
     # Saving ...
     if save:
         print('Saving optimal routes to csv ...')
-        optimalRoutes.to_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + day + ".csv", index=False)
+        WriteRoutes(optimalRoutes, "Data" + sep + "Routes" + sep + "optimalRoutes" + day + ".csv")
         print('... Saved!')
 
     return optimalRoutes
 
-def Visualisations():
-    #routes = pd.read_csv("Data" + sep + "AlexChosenRoutesMonday.csv", converters = {"Route": literal_eval})
-    routes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutesMonday.csv", converters = {"Route": literal_eval})
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+def GenerateOptimalSolution(day = "Monday", workers = 1, improve = True):
+    '''
+    Default solution is a weekday solution
+    Please call with day = "Saturday" for weekend solution
+    '''
+    # Regenerate routes first
+    data = LoadModelData()
+    routeData = RouteGenUsingKCI(day, workers = workers, data = data, improve = improve)
+    supermarkets = list(data[0]["Supermarket"])
+
+    return SelectOptimalRoutes(routeData, supermarkets, day)
 
-    optimalRoutes = routes.loc[routes['State'] == 1]["Route"].to_list()
+def SelectSavedRoutes(day = "Monday"):
+    '''
+    Selects the optimal routes for day from the route pool saved by RouteGenUsingKCI
+    '''
+    from routepool import ReadRoutes
+    from stores import ReadLocations
 
-    # Standalone testing
-    # routes =    [["Warehouse", "New World Albany", "Pak 'n Save Henderson", "Four Square Everglade", "Warehouse"],
-    #            ["Warehouse", "New World Milford", "Pak 'n Save Mangere", "Fresh Collective Alberton", "Warehouse"]]
+    routeData = ReadRoutes("Data" + sep + "Routes" + sep + "generatedRoutes" + day + ".csv")
+    locationData = ReadLocations()
+    supermarkets = list(locationData.loc[locationData["Type"] != "Warehouse", "Supermarket"])
 
+    return SelectOptimalRoutes(routeData, supermarkets, day)
 
-    VisualiseRoutes(locationData, optimalRoutes, 'weekday') # Saves map to html
+def GenerateOptimalSolutionCG(day = "Monday", improve = True):
+    '''
+    Same as GenerateOptimalSolution but selects routes by column generation, pricing
+    new routes on demand instead of generating the whole route pool first
+    improve = False keeps the plain cheapest insertion tours of the priced routes
+    '''
+    from RouteGenKCI import RegionDemand
+    from routeselectionCG import RouteSelectionCG
 
-    # Weekend visualisation
-    routes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutesSaturday.csv", converters = {"Route": literal_eval})
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+    locationData, timeData, demandPreds = LoadModelData()
+    supermarkets = list(locationData["Supermarket"])
+    demand = dict(zip(supermarkets, RegionDemand(locationData, supermarkets, demandPreds, day)))
 
-    optimalRoutes = routes.loc[routes['State'] == 1]["Route"].to_list()
+    routes, obj = RouteSelectionCG(supermarkets, demand, timeData, improve = improve)
 
-    VisualiseRoutes(locationData, optimalRoutes, 'weekend') # Saves map to html
+    return SaveOptimalRoutes(routes, supermarkets, day)
 
-    return
+# Data shared by the GenerateWeek worker processes, set once by _InitWeekWorker
+_weekData = None
+_weekRegions = None
+
+def _InitWeekWorker(locationData, timeHandle, demandPreds, l):
+    from traveltimes import TravelTimeMatrix
+
+    global _weekData, _weekRegions
+    _weekData = (locationData, TravelTimeMatrix.attach(timeHandle), demandPreds)
+    _weekRegions = l
+
+def _WeekDayWorker(day):
+    start = perf_counter()
+    routeData = RouteGenUsingKCI(day, data = _weekData, l = _weekRegions)
+    optimalRoutes = SelectOptimalRoutes(routeData, list(_weekData[0]["Supermarket"]), day)
+    return optimalRoutes, len(routeData), perf_counter() - start
+
+def GenerateWeek(days = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"), workers = None):
+    '''
+    Generate and select the optimal routes for every day in days concurrently, writing each
+    optimalRoutes<Day>.csv. Location, demand and travel time data are loaded and the regions
+    clustered once for the whole week.
+
+    Inputs
+    ------
+    days : tuple
+    Days of the week to plan
+
+    workers : integer
+    Number of worker processes, one per day by default
+
+    Returns
+    -------
+    week : dict
+        day -> dataframe of optimal routes
+    '''
+    from RouteGenKCI import KRegionalClusters
+
+    data = LoadModelData()
+    locationData, timeData, demandPreds = data
+    l = KRegionalClusters(locationData, k=2, plot=False)
+
+    start = perf_counter()
+    timeHandle = timeData.share()
+    try:
+        with ProcessPoolExecutor(max_workers = workers or len(days), initializer = _InitWeekWorker,
+                                 initargs = (locationData, timeHandle, demandPreds, l)) as pool:
+            results = list(pool.map(_WeekDayWorker, days))
+    finally:
+        timeData.close(unlink = True)
+    total = perf_counter() - start
+
+    # Per day wall clock and total throughput
+    week = {}
+    generated = 0
+    for day, (optimalRoutes, nRoutes, seconds) in zip(days, results):
+        week[day] = optimalRoutes
+        generated += nRoutes
+        print(f"{day}: {seconds:.2f}s ({nRoutes} routes generated, {len(optimalRoutes)} selected)")
+    print(f"Week: {len(days)} days in {total:.2f}s, {len(days) / total * 60:.1f} days/min, {generated / total:.0f} routes/s")
+
+    return week
+
+def Visualisations(days = ("Monday", "Saturday")):
+    '''
+    Draws the optimal routes of every day in days on one map (routes_map_week.html), with a
+    road and a straight line layer per day
+    '''
+    from routepool import ReadRoutes
+    from stores import ReadLocations
+    from visualisations import VisualiseWeek
+
+    locationData = ReadLocations()
+    routeSets = {}
+    for day in days:
+        routes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + day + ".csv")
+        routeSets[day] = routes.loc[routes['State'] == 1]["Route"].to_list()
+
+    # Standalone testing
+    # routeSets = {"Test": [["Warehouse", "New World Albany", "Pak 'n Save Henderson", "Four Square Everglade", "Warehouse"],
+    #                       ["Warehouse", "New World Milford", "Pak 'n Save Mangere", "Fresh Collective Alberton", "Warehouse"]]}
+
+    VisualiseWeek(locationData, routeSets, 'week') # Saves map to html
+
+def Benchmark(stores = (100, 200), auckland = True, day = "Monday", repeat = 3, scenarios = 1000, output = None, baseline = None):
+    '''
+    Benchmarks the model on the Auckland data and synthetic networks of each size in stores,
+    comparing against baseline (an earlier results file) if given
+    '''
+    from benchmark import AucklandInstance, SyntheticInstance, RunBenchmarks, CompareBenchmarks
+
+    instances = ([AucklandInstance()] if auckland else []) + [SyntheticInstance(n) for n in stores]
+    run = RunBenchmarks(instances, output, day = day, repeat = repeat, scenarios = scenarios)
+    if baseline is not None:
+        comparison = CompareBenchmarks(baseline, run)
+        print(comparison.to_string(index = False))
+        regressions = comparison[comparison["regression"]]
+        if len(regressions):
+            print(f"{len(regressions)} regressions:", ", ".join(regressions["instance"] + " " + regressions["benchmark"]))
+    return run
+
+def RunSimulation(weekday = "Monday", weekend = "Saturday", halfWidth = 10, seed = None, sampling = "iid"):
+    import matplotlib.pyplot as plt
+    from DataAnalysis import clean_data
+    from routepool import ReadRoutes
+    from stores import ReadLocations
+    from simulation import setupbootstrap, simulate_until, variance_reduction
 
-def RunSimulation(weekday = "Monday", weekend = "Saturday"):
     # Initialise list of optimal solution routes
-    weekRoutes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + weekday + ".csv", converters = {"Route": literal_eval})
-    wkndRoutes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + weekend + ".csv", converters = {"Route": literal_eval})
-    wmed = []
-    med = []
+    weekRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + weekday + ".csv")
+    wkndRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + weekend + ".csv")
 
     # Get cleaned dataframe
     demandData = pd.read_csv("Data" + sep + "demandData.csv")
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    demandData = clean_data(demandData,locationData)
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
-
-    # 1000 runs for monte carlo simulation for weekday
-    cost = []
-    for i in range(1000):
-        # reset lists for optimal solution
-        wopt = []
-        opt = []
-        for j in range(1000):
-            # Import travel times between supermarkets + demand predictions per store
-            opt.append(simulate(weekRoutes, demandData, locationData, wknd=False))
-            wopt.append(simulate(wkndRoutes, demandData, locationData, wknd=True))
-
-        # Sorting and getting medians
-        cost.append(opt)
-        opt.sort()
-        med.append(opt[500])
-        wopt.sort()
-        wmed.append(wopt[500])
-
-    plt.hist(cost, density=True, histtype='stepfilled', alpha=0.2)
-    plt.show()
+    locationData = ReadLocations()
+    demandData = clean_data(demandData, ReadLocations(fixTypes = False))
+    [a,b,c] = setupbootstrap(demandData,wknd=False)
+    [d,e,f] = setupbootstrap(demandData,wknd=True)
 
-    # Histograms for optimal solutions, on weekday and weekend
-    plt.hist(opt, density=True, histtype='stepfilled', alpha=0.2)
-    plt.show()
-    plt.hist(wopt, density=True, histtype='stepfilled', alpha=0.2)
-    plt.show()
+    seedSeq = np.random.SeedSequence(seed)
+    print("Simulation seed:", seedSeq.entropy)
+    weekSeed, wkndSeed = seedSeq.spawn(2)
 
-    # One-sample t-test
-    stats.ttest_1samp(opt,popmean=0) # Weekday
-    stats.ttest_1samp(wopt,popmean=0) # Weekend
+    # Monte carlo simulation, up to 1000*1000 runs each, stopping once the 95% CI for the mean is within +/- halfWidth
+    opt = simulate_until(weekRoutes, locationData, a, b, c, wknd=False, halfWidth=halfWidth, seed=weekSeed, sampling=sampling)
+    wopt = simulate_until(wkndRoutes, locationData, d, e, f, wknd=True, halfWidth=halfWidth, seed=wkndSeed, sampling=sampling)
+    print("Variance reduction from", sampling, "sampling:", variance_reduction(weekRoutes, locationData, a, b, c, wknd=False, sampling=sampling, seed=weekSeed)["reduction"])
 
-    # Histograms for medians
-    plt.hist(med, density=True, histtype='stepfilled', alpha=0.2)
-    plt.show()
-    plt.hist(wmed, density=True, histtype='stepfilled', alpha=0.2)
+    # Histograms for optimal solutions, on weekday and weekend
+    f, (ax1, ax2) = plt.subplots(1, 2, figsize=(15,10))
+    for ax, summary, title in [(ax1, opt, "Weekday Optimal Solution"), (ax2, wopt, "Weekend Optimal Solution")]:
+        summary.histogram.plot(ax, alpha=0.2)
+        lower, upper = summary.confint(alpha=0.05)
+        ax.axvline(x=lower, color='r', linewidth=2)
+        ax.axvline(x=upper, color='r', linewidth=2)
+        ax.axvline(x=summary.quantile(0.025), color='b', linewidth=2)
+        ax.axvline(x=summary.quantile(0.975), color='b', linewidth=2)
+        ax.set_title(title)
+        ax.set_xlabel("Optimal Solution Value ($)")
+        ax.set_ylabel("Probablity")
     plt.show()
 
-    # Percentile interval
-    med.sort()
-    med[25]
-    med[975]
-    wmed.sort()
-    wmed[25]
-    wmed[975]
+    # Mean, confidence interval, median and percentile interval
+    for name, summary in [("Weekday", opt), ("Weekend", wopt)]:
+        report = summary.report(alpha=0.05)
+        print(f"{name}: {report['n']} runs")
+        print("Mean and CI:", report["mean"], (report["ciLower"], report["ciUpper"]))
+        print("Median:", report["quantiles"][0.5])
+        print("Percentile interval:", report["quantiles"][0.025], report["quantiles"][0.975])
+
+def RunSimulation2(weekday="Monday", weekend="Saturday", seed=None, workers=1):
+    import statistics
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import statsmodels.stats.weightstats as sms
+    from scipy import stats
+    from DataAnalysis import clean_data
+    from routepool import ReadRoutes
+    from stores import ReadLocations
+    from simulation import setupbootstrap, simulate_parallel
 
-def RunSimulation2(weekday="Monday", weekend="Saturday"):
     # Initialise list of optimal solution routes
-    weekRoutes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + weekday + ".csv", converters = {"Route": literal_eval})
-    wkndRoutes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + weekend + ".csv", converters = {"Route": literal_eval})
+    weekRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + weekday + ".csv")
+    wkndRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + weekend + ".csv")
 
     # Get cleaned dataframe
     demandData = pd.read_csv("Data" + sep + "demandData.csv")
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    demandData = clean_data(demandData,locationData)
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+    locationData = ReadLocations()
+    demandData = clean_data(demandData, ReadLocations(fixTypes = False))
     [a,b,c] = setupbootstrap(demandData,wknd=False)
     [d,e,f] = setupbootstrap(demandData,wknd=True)
 
-    # 1000 runs for monte carlo simulation for weekday
-    wopt = []
-    opt = []
-    for i in range(1000):
-        # Import travel times between supermarkets + demand predictions per store
-        opt.append(simulate(weekRoutes, locationData, a, b, c, wknd=False))
-        wopt.append(simulate(wkndRoutes, locationData, d, e, f, wknd=True))
+    # Seed of the run, print it so the run can be reproduced with RunSimulation2(seed = ...)
+    seedSeq = np.random.SeedSequence(seed)
+    print("Simulation seed:", seedSeq.entropy)
+    weekSeed, wkndSeed = seedSeq.spawn(2)
+
+    # 1000 runs for monte carlo simulation for weekday and weekend
+    opt = list(simulate_parallel(weekRoutes, locationData, a, b, c, wknd=False, n=1000, seed=weekSeed, workers=workers))
+    wopt = list(simulate_parallel(wkndRoutes, locationData, d, e, f, wknd=True, n=1000, seed=wkndSeed, workers=workers))
 
     # Seaborn plot 
     ax = sns.distplot(wopt, bins=100)
@@ -0,0 +1,437 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import time
+from os import sep
+from instrument import tracer
+
+# Input files of the model, hashed into the key of every stage that reads them. Every stage
+# takes the data directory so it can also run on a generated instance (see instances.py)
+locationsFile = "FoodstuffLocations.csv"
+demandModelFile = "demandModel.csv"
+travelTimesFile = "FoodstuffTravelTimes.csv"
+demandDataFile = "demandData.csv"
+
+# Modules whose source is hashed into the key of each stage, so editing the code a stage runs
+# rebuilds its artifacts instead of serving ones made by the old code
+generateCode = ("RouteGenKCI", "routepool", "stores", "traveltimes", "solvers")
+selectCode = ("routeselectionV2", "routeselectionV1", "routepool", "stores", "solvers")
+simulateCode = ("simulation", "simstats", "DataAnalysis", "routepool", "stores", "traveltimes")
+visualiseCode = ("visualisations", "routepool", "stores")
+
+class ArtifactCache:
+    '''
+    Content addressed store for the outputs of the pipeline stages. A stage's key is the hash
+    of its name, parameters, the contents of its input files, the source of the modules it
+    runs and the keys of the stages it reads from, so its outputs are reused until one of
+    those changes.
+
+    Inputs
+    ------
+    root : string
+    Directory holding one <stage>/<key> directory per artifact
+
+    Notes:
+    ------
+    Every artifact directory has a manifest.json recording what produced it. Artifacts are built
+    in a temporary directory and renamed into place, so a key only exists once it is complete.
+    '''
+
+    def __init__(self, root = "Data" + sep + "Cache"):
+        self.root = root
+        self._hashes = {}
+
+    def fileHash(self, path):
+        '''
+        sha256 of a file's contents, remembered while its mtime and size are unchanged
+        '''
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self._hashes[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+        return digest
+
+    def moduleHash(self, name):
+        '''
+        sha256 of a module's source file (found without importing it), None if it cannot be found
+        '''
+        spec = importlib.util.find_spec(name)
+        if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+            return None
+        return self.fileHash(spec.origin)
+
+    def key(self, stage, params, files = (), upstream = (), code = ()):
+        '''
+        Key of a stage run, see the class notes
+        '''
+        record = {"stage": stage, "params": params,
+                  "files": {os.path.basename(path): self.fileHash(path) for path in files},
+                  "code": {name: self.moduleHash(name) for name in code},
+                  "upstream": list(upstream)}
+        return hashlib.sha256(json.dumps(record, sort_keys = True, default = str).encode()).hexdigest()
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, key)
+
+    def exists(self, stage, key):
+        return os.path.exists(os.path.join(self.path(stage, key), "manifest.json"))
+
+    def manifest(self, stage, key):
+        with open(os.path.join(self.path(stage, key), "manifest.json")) as f:
+            return json.load(f)
+
+    def run(self, stage, params, build, files = (), upstream = (), code = (), force = False):
+        '''
+        Run build(directory) to produce a stage's outputs unless they are already cached
+
+        Inputs
+        ------
+        stage : string
+        Stage name
+
+        params : dict
+        Everything besides the input files and upstream stages that changes the outputs
+
+        build : function
+        Called with the directory to write the outputs into
+
+        files : list
+        Input file paths
+
+        upstream : list
+        Keys of the artifacts the stage reads
+
+        code : tuple
+        Names of the modules the stage runs
+
+        force : boolean
+        True to rebuild even if the key exists
+
+        Returns
+        -------
+        key : string
+        path : string
+            directory holding the outputs
+        '''
+        key = self.key(stage, params, files, upstream, code)
+        path = self.path(stage, key)
+        if self.exists(stage, key) and not force:
+            print(f"{stage} {key[:12]}: cached")
+            tracer.count("cache.hits")
+            return key, path
+        tracer.count("cache.misses")
+
+        start = time.perf_counter()
+        tmpPath = path + ".tmp" + str(os.getpid())
+        shutil.rmtree(tmpPath, ignore_errors = True)
+        os.makedirs(tmpPath)
+        try:
+            with tracer.stage(stage, key = key[:12]):
+                build(tmpPath)
+            manifest = {"stage": stage, "key": key, "params": params,
+                        "files": {path: self.fileHash(path) for path in files},
+                        "code": {name: self.moduleHash(name) for name in code},
+                        "upstream": list(upstream), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "seconds": time.perf_counter() - start}
+            with open(os.path.join(tmpPath, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent = 1, default = str)
+            shutil.rmtree(path, ignore_errors = True)
+            os.replace(tmpPath, path)
+        finally:
+            shutil.rmtree(tmpPath, ignore_errors = True)
+        print(f"{stage} {key[:12]}: built in {time.perf_counter() - start:.2f}s")
+        return key, path
+
+def GenerateStage(cache, day, k = 2, seed = 0, capacity = 12, maxTime = 14400, limit = 50, improve = True, workers = 1, data = "Data",
+                  force = False):
+    '''
+    Route generation for day (RoutePool over k means regions), cached on the locations,
+    demand predictions, travel times and settings. seed fixes the k means initialisation
+    and python's random module (used for tie breaking), improve = False skips the 2-opt/Or-opt
+    improvement of the tours.
+
+    Returns
+    -------
+    key : string
+    routesPath : string
+        csv of the generated route pool (read with routepool.ReadRoutes)
+    '''
+    params = {"day": day, "k": k, "seed": seed, "capacity": capacity, "maxTime": maxTime, "limit": limit, "improve": improve}
+    locationsPath, demandModelPath, travelTimesPath = [os.path.join(data, f) for f in (locationsFile, demandModelFile, travelTimesFile)]
+
+    def Build(path):
+        import random
+        import pandas as pd
+        from RouteGenKCI import KRegionalClusters, RoutePool
+        from routepool import WriteRoutes
+        from stores import ReadLocations
+        from traveltimes import TravelTimeMatrix
+
+        random.seed(seed)
+        locationData = ReadLocations(locationsPath)
+        locationData = locationData[locationData["Type"] != "Warehouse"]
+        timeData = TravelTimeMatrix.from_csv(travelTimesPath)
+        demandPreds = pd.read_csv(demandModelPath)
+        l = KRegionalClusters(locationData, k = k, plot = False, seed = seed)
+        routeData, stores = RoutePool(locationData, timeData, l, demandPreds, day, limit = limit, workers = workers,
+                                      capacity = capacity, maxTime = maxTime, improve = improve)
+        WriteRoutes(routeData, os.path.join(path, "routes.csv"))
+
+    key, path = cache.run("generate", params, Build, files = [locationsPath, demandModelPath, travelTimesPath], code = generateCode,
+                          force = force)
+    return key, os.path.join(path, "routes.csv")
+
+def SelectStage(cache, generated, day, trucks = 20, backend = None, data = "Data", force = False):
+    '''
+    Route selection (pruned pool, RouteSelectionV2) over the output of GenerateStage
+
+    Inputs
+    ------
+    generated : tuple
+    (key, routesPath) from GenerateStage
+
+    Returns
+    -------
+    key : string
+    routesPath : string
+        csv of the selected routes, only written when every supermarket is covered
+    '''
+    generateKey, generatedPath = generated
+    params = {"day": day, "trucks": trucks, "backend": backend}
+    locationsPath = os.path.join(data, locationsFile)
+
+    def Build(path):
+        from routepool import ReadRoutes, WriteRoutes, PruneRoutePool
+        from routeselectionV2 import RouteSelectionV2
+        from stores import ReadLocations
+
+        locationData = ReadLocations(locationsPath)
+        supermarkets = list(locationData.loc[locationData["Type"] != "Warehouse", "Supermarket"])
+        routeData, report = PruneRoutePool(ReadRoutes(generatedPath))
+        routes, obj = RouteSelectionV2(routeData, supermarkets, backend, trucks = trucks)
+        optimalRoutes = routes.loc[routes['State'] == 1]
+        covered = set(s for route in optimalRoutes['Route'] for s in route)
+        missing = [s for s in supermarkets if s not in covered]
+        if missing:
+            raise RuntimeError(f"Selected routes for {day} miss {missing}")
+        WriteRoutes(optimalRoutes, os.path.join(path, "optimalRoutes.csv"))
+        with open(os.path.join(path, "selection.json"), "w") as f:
+            json.dump({"objective": obj, "pruning": report}, f, indent = 1)
+
+    key, path = cache.run("select", params, Build, files = [locationsPath], upstream = [generateKey], code = selectCode,
+                          force = force)
+    return key, os.path.join(path, "optimalRoutes.csv")
+
+def SimulateStage(cache, weekday, weekend, halfWidth = 10, seed = 0, sampling = "iid", maxScenarios = 1000*1000, data = "Data",
+                  force = False):
+    '''
+    Monte carlo simulation (simulation.simulate_until) of a weekday and a weekend selection
+
+    Inputs
+    ------
+    weekday, weekend : tuple
+    (key, routesPath) from SelectStage
+
+    Returns
+    -------
+    key : string
+    reportPath : string
+        json with the mean, confidence interval and quantiles of each
+    '''
+    params = {"halfWidth": halfWidth, "seed": seed, "sampling": sampling, "maxScenarios": maxScenarios}
+    locationsPath, demandDataPath = os.path.join(data, locationsFile), os.path.join(data, demandDataFile)
+
+    def Build(path):
+        import numpy as np
+        import pandas as pd
+        from DataAnalysis import clean_data
+        from routepool import ReadRoutes
+        from simulation import setupbootstrap, simulate_until
+        from stores import ReadLocations
+
+        demandData = clean_data(pd.read_csv(demandDataPath), ReadLocations(locationsPath, fixTypes = False))
+        locationData = ReadLocations(locationsPath)
+        weekSeed, wkndSeed = np.random.SeedSequence(seed).spawn(2)
+        report = {}
+        for name, (key, routesPath), wknd, seedSeq in [("weekday", weekday, False, weekSeed), ("weekend", weekend, True, wkndSeed)]:
+            summary = simulate_until(ReadRoutes(routesPath), locationData, *setupbootstrap(demandData, wknd = wknd), wknd = wknd,
+                                     halfWidth = halfWidth, maxScenarios = maxScenarios, seed = seedSeq, sampling = sampling)
+            report[name] = summary.report()
+        with open(os.path.join(path, "report.json"), "w") as f:
+            json.dump(report, f, indent = 1)
+
+    key, path = cache.run("simulate", params, Build, files = [locationsPath, demandDataPath],
+                          upstream = [weekday[0], weekend[0]], code = simulateCode, force = force)
+    return key, os.path.join(path, "report.json")
+
+def VisualiseStage(cache, selections, data = "Data", force = False):
+    '''
+    One route map with a layer per selection
+
+    Inputs
+    ------
+    selections : dict
+    name -> (key, routesPath) from SelectStage
+
+    Returns
+    -------
+    key : string
+    path : string
+        directory holding routes_map_week.html
+    '''
+    names = sorted(selections)
+    locationsPath = os.path.join(data, locationsFile)
+
+    def Build(path):
+        from routepool import ReadRoutes
+        from stores import ReadLocations
+        from visualisations import VisualiseWeek
+
+        routeSets = {name: ReadRoutes(selections[name][1])["Route"].to_list() for name in names}
+        VisualiseWeek(ReadLocations(locationsPath), routeSets, "week", path = path)
+
+    return cache.run("visualise", {"names": names}, Build, files = [locationsPath],
+                     upstream = [selections[name][0] for name in names], code = visualiseCode, force = force)
+
+def RunPipeline(days = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"), weekday = "Monday", weekend = "Saturday",
+                generate = None, select = None, simulate = None, visualise = False, publish = True, cache = None, data = "Data"):
+    '''
+    generate -> select for every day, then simulate the weekday/weekend selections and
+    optionally draw the maps, skipping every stage whose inputs have not changed
+
+    Inputs
+    ------
+    days : tuple
+    Days to plan
+
+    weekday, weekend : string
+    Days to simulate, None to skip the simulation
+
+    generate, select, simulate : dict
+    Extra keyword arguments of GenerateStage, SelectStage and SimulateStage, None for none
+
+    visualise : boolean
+    True to draw the route maps of every day
+
+    publish : boolean
+    True to also copy each selection to Data/Routes/optimalRoutes<Day>.csv for the other commands
+
+    cache : ArtifactCache
+    Where the artifacts live, Data/Cache by default
+
+    data : string
+    Directory holding the input files, e.g. an instance written by instances.WriteInstance
+
+    Returns
+    -------
+    results : dict
+        stage -> day (or "report"/"maps") -> (key, path)
+    '''
+    if cache is None:
+        cache = ArtifactCache()
+    generate, select, simulate = generate or {}, select or {}, simulate or {}
+    results = {"generate": {}, "select": {}}
+    for day in days:
+        results["generate"][day] = GenerateStage(cache, day, data = data, **generate)
+        results["select"][day] = SelectStage(cache, results["generate"][day], day, data = data, **select)
+        if publish:
+            from routepool import ReadRoutes, WriteRoutes
+            WriteRoutes(ReadRoutes(results["select"][day][1]), "Data" + sep + "Routes" + sep + "optimalRoutes" + day + ".csv")
+
+    if weekday is not None and weekend is not None:
+        for day in (weekday, weekend):
+            if day not in results["select"]:
+                results["generate"][day] = GenerateStage(cache, day, data = data, **generate)
+                results["select"][day] = SelectStage(cache, results["generate"][day], day, data = data, **select)
+        results["simulate"] = {"report": SimulateStage(cache, results["select"][weekday], results["select"][weekend], data = data,
+                                                       **simulate)}
+
+    if visualise:
+        results["visualise"] = {"maps": VisualiseStage(cache, results["select"], data = data)}
+    return results
+
+def StressTest(stores = (500, 1000), centres = 3, seed = 0, days = ("Monday", "Saturday"), simulate = False, root = "Data" + sep + "Instances",
+               cache = None):
+    '''
+    Run the pipeline on generated networks of each size (see instances.GenerateInstance), each
+    written once to root/<name> and reused afterwards
+
+    Inputs
+    ------
+    stores : tuple
+    Network sizes (supermarkets)
+
+    centres, seed
+    As for instances.GenerateInstance
+
+    days : tuple
+    Days to plan, the first (weekday) and last (weekend) are simulated if simulate is True
+
+    simulate : boolean
+    True to also run the simulation stage
+
+    root : string
+    Directory holding the generated instances
+
+    cache : ArtifactCache
+    Where the artifacts live, Data/Cache by default
+
+    Returns
+    -------
+    summary : list
+        one dict per network and day with the size, routes generated and selected, objective
+        and the seconds each stage took to build (or the error if the day could not be planned),
+        plus a row per network for the simulation
+    '''
+    from instances import GenerateInstance, WriteInstance
+    from routepool import ReadRoutes
+
+    if cache is None:
+        cache = ArtifactCache()
+    summary = []
+    for n in stores:
+        data = os.path.join(root, f"synthetic{n}-{centres}-{seed}")
+        if not os.path.exists(os.path.join(data, demandDataFile)):
+            WriteInstance(GenerateInstance(n, centres, seed), data)
+
+        # One region per 20 stores and trucks in the same proportion as Auckland (20 for 46 stores)
+        generate, select = {"k": max(2, n//20), "seed": seed}, {"trucks": -(-20*n//46)}
+        selections = {}
+        for day in days:
+            row = {"stores": n, "day": day}
+            try:
+                results = RunPipeline([day], None, None, generate, select, publish = False, cache = cache, data = data)
+            except RuntimeError as e:
+                # Typically a store no generated route can reach, which is what a stress test is for
+                row["error"] = str(e)[:200]
+                summary.append(row)
+                print(row)
+                continue
+            (generateKey, generatedPath), (selectKey, selectedPath) = results["generate"][day], results["select"][day]
+            selections[day] = results["select"][day]
+            with open(os.path.join(cache.path("select", selectKey), "selection.json")) as f:
+                selection = json.load(f)
+            row.update({"generated": len(ReadRoutes(generatedPath)), "selected": len(ReadRoutes(selectedPath)),
+                        "objective": selection["objective"], "generateSeconds": cache.manifest("generate", generateKey)["seconds"],
+                        "selectSeconds": cache.manifest("select", selectKey)["seconds"]})
+            summary.append(row)
+            print(row)
+
+        if simulate and days[0] in selections and days[-1] in selections:
+            key, reportPath = SimulateStage(cache, selections[days[0]], selections[days[-1]], data = data)
+            summary.append({"stores": n, "day": "simulate", "simulateSeconds": cache.manifest("simulate", key)["seconds"]})
+            print(summary[-1])
+    return summary
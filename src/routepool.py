@@ -0,0 +1,305 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import numpy as np
+import pandas as pd
+from ast import literal_eval
+import scipy.sparse as sp
+import json
+import os
+from instrument import tracer
+
+def PruneRoutePool(routeData, dominance = False, centralNode = 'Warehouse'):
+    """
+    Shrinks a generated route pool before route selection
+
+    Inputs:
+    -------
+    routeData : pd.DataFrame
+        dataframe containing the all the routes and their corresponding cost
+
+        Example:
+                        Route                                           Cost
+        0   ['Warehouse', 'Four Square ...']                            3000
+        1   ['Warehouse', 'Four Square ...']                            4000
+
+    dominance : boolean
+        True to also drop routes whose store set is contained in the store set of a route that
+        is no dearer. Only safe if the coverage constraints may be relaxed to >= 1 (i.e. dropping
+        a stop never makes a route longer), so it is off by default.
+
+    centralNode : string
+        node every route starts and ends at, ignored when comparing store sets
+
+    Outputs:
+    -------
+    prunedData : pd.DataFrame
+        the cheapest route over each distinct store set (in order of first appearance), minus
+        any dominated routes
+
+    report : dict
+        number of routes in, duplicates removed, dominated removed and routes out
+
+    Notes:
+    ------
+    RouteConstruction2 re-discovers the same store sets for different min values so the pool
+    holds many routes over the same stores. Only the cheapest of those can be in an optimal
+    set partitioning solution, so removing the rest leaves the optimum unchanged.
+    """
+    storeSets = [frozenset(route) - {centralNode} for route in routeData['Route']]
+    costs = routeData['Cost'].to_numpy(dtype = float)
+
+    # Cheapest route over each store set, first one wins ties
+    best = {}
+    for i, storeSet in enumerate(storeSets):
+        j = best.get(storeSet)
+        if j is None or costs[i] < costs[j]:
+            best[storeSet] = i
+    keep = sorted(best.values())
+    duplicates = len(routeData) - len(keep)
+
+    dominated = 0
+    if dominance and keep:
+        # Bit packed store membership so subset tests are vectorised over routes
+        stores = sorted(set().union(*(storeSets[i] for i in keep)))
+        position = {store: k for k, store in enumerate(stores)}
+        member = np.zeros((len(keep), len(stores)), dtype = bool)
+        for row, i in enumerate(keep):
+            member[row, [position[store] for store in storeSets[i]]] = True
+        packed = np.packbits(member, axis = 1)
+        keptCosts = costs[keep]
+
+        alive = np.ones(len(keep), dtype = bool)
+        for row in np.argsort(keptCosts, kind = "stable")[::-1]:
+            # Any other live route, no dearer, that visits every store on this one
+            others = alive & (keptCosts <= keptCosts[row])
+            others[row] = False
+            if np.any(others) and np.any(np.all(packed[others] & packed[row] == packed[row], axis = 1)):
+                alive[row] = False
+        dominated = int((~alive).sum())
+        keep = [i for i, a in zip(keep, alive) if a]
+
+    prunedData = routeData.iloc[keep].reset_index(drop = True)
+    report = {"input": len(routeData), "duplicates": duplicates, "dominated": dominated, "output": len(prunedData)}
+    return prunedData, report
+
+class CompactRoutePool:
+    '''
+    Columnar route pool: a store dictionary, the stops of every route in an int16 CSR layout
+    (stop indices plus row offsets) and one array per extra column (Cost, Day, State ...)
+
+    Attributes
+    ----------
+    stores : list
+    Store names, stops are indices into this list
+
+    stops : np.ndarray (int16)
+    Stops of all routes back to back, route i is stops[offsets[i]:offsets[i+1]]
+
+    offsets : np.ndarray (int64)
+    Row offsets into stops, one longer than the number of routes
+
+    columns : dict
+    Column name -> 1-D array, text columns are stored as int16 codes into categories[name]
+    (-1 for a missing value)
+
+    Notes:
+    ------
+    save/load write plain .npy files into a directory so load can np.memmap them, no literal_eval
+    and no per-row python objects until to_frame is called.
+    '''
+
+    def __init__(self, stores, stops, offsets, columns = None, categories = None):
+        self.stores = list(stores)
+        self.stops = stops
+        self.offsets = offsets
+        self.columns = dict(columns or {})
+        self.categories = dict(categories or {})
+        self.meta = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def route(self, i):
+        return [self.stores[k] for k in self.stops[self.offsets[i]:self.offsets[i+1]]]
+
+    def column(self, name):
+        '''
+        Values of a column, text columns decoded back to their labels
+        '''
+        if name in self.categories:
+            # pd.factorize codes missing values as -1, which indexes the NaN appended after the labels
+            return np.asarray(list(self.categories[name]) + [np.nan], dtype = object)[self.columns[name]]
+        return self.columns[name]
+
+    @classmethod
+    def from_frame(cls, routeData, stores = None):
+        '''
+        Build from a Route/Cost(/...) dataframe, stores default to order of first appearance
+        '''
+        routes = list(routeData['Route'])
+        if stores is None:
+            stores = list(dict.fromkeys(store for route in routes for store in route))
+        if len(stores) > np.iinfo(np.int16).max:
+            raise ValueError("Too many stores for int16 stop indices")
+        position = {store: k for k, store in enumerate(stores)}
+
+        lengths = np.fromiter((len(route) for route in routes), dtype = np.int64, count = len(routes))
+        offsets = np.zeros(len(routes) + 1, dtype = np.int64)
+        np.cumsum(lengths, out = offsets[1:])
+        stops = np.fromiter((position[store] for route in routes for store in route), dtype = np.int16, count = int(offsets[-1]))
+
+        columns, categories = {}, {}
+        for name in routeData.columns:
+            if name == 'Route':
+                continue
+            values = routeData[name]
+            if pd.api.types.is_numeric_dtype(values):
+                columns[name] = values.to_numpy()
+            else:
+                codes, labels = pd.factorize(values)
+                columns[name] = codes.astype(np.int16)
+                categories[name] = list(labels)
+        return cls(stores, stops, offsets, columns, categories)
+
+    def to_frame(self):
+        '''
+        Dataframe in the same layout as reading the csv with converters = {"Route": literal_eval}
+        '''
+        stores = np.asarray(self.stores, dtype = object)
+        routes = [stores[self.stops[self.offsets[i]:self.offsets[i+1]]].tolist() for i in range(len(self))]
+        routeData = pd.DataFrame({'Route': pd.Series(routes, dtype = object)})
+        for name in self.columns:
+            routeData[name] = self.column(name)
+        return routeData
+
+    def incidence(self, nodes):
+        '''
+        Store x route incidence matrix (see routeselectionV1.RouteIncidence) straight from the CSR arrays
+        '''
+        nodePosition = {node: i for i, node in enumerate(nodes)}
+        position = np.array([nodePosition.get(store, -1) for store in self.stores], dtype = np.int64)
+        rows = position[self.stops]
+        cols = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        valid = rows >= 0
+        incidence = sp.csr_matrix((np.ones(valid.sum()), (rows[valid], cols[valid])), shape = (len(nodes), len(self)))
+        incidence.sum_duplicates()
+        incidence.data[:] = 1
+        return incidence
+
+    @classmethod
+    def concat(cls, pools, key = None, labels = None):
+        '''
+        Stack pools (e.g. the days of a week) over a shared store dictionary, optionally tagging
+        each row with labels[i] in a new text column called key
+        '''
+        stores = list(dict.fromkeys(store for pool in pools for store in pool.stores))
+        position = {store: k for k, store in enumerate(stores)}
+        stops, offsets, columns = [], [np.zeros(1, dtype = np.int64)], {}
+        categories = {}
+        total = 0
+        for pool in pools:
+            remap = np.array([position[store] for store in pool.stores], dtype = np.int16)
+            stops.append(remap[pool.stops])
+            offsets.append(pool.offsets[1:] + total)
+            total += int(pool.offsets[-1])
+        names = [name for name in pools[0].columns if all(name in pool.columns for pool in pools)]
+        for name in names:
+            values = np.concatenate([np.asarray(pool.column(name)) for pool in pools])
+            if name in pools[0].categories:
+                codes, labelsOut = pd.factorize(values)
+                columns[name], categories[name] = codes.astype(np.int16), list(labelsOut)
+            else:
+                columns[name] = values
+        if key is not None:
+            columns[key] = np.repeat(np.arange(len(pools), dtype = np.int16), [len(pool) for pool in pools])
+            categories[key] = list(labels)
+        return cls(stores, np.concatenate(stops), np.concatenate(offsets), columns, categories)
+
+    def save(self, path, csvStat = None):
+        '''
+        Write the pool as .npy files (plus meta.json) into the directory path
+        '''
+        os.makedirs(path, exist_ok = True)
+        np.save(os.path.join(path, "stops.npy"), np.ascontiguousarray(self.stops, dtype = np.int16))
+        np.save(os.path.join(path, "offsets.npy"), np.ascontiguousarray(self.offsets, dtype = np.int64))
+        for name, values in self.columns.items():
+            np.save(os.path.join(path, "column_" + name + ".npy"), np.ascontiguousarray(values))
+        meta = {"stores": self.stores, "columns": list(self.columns), "categories": self.categories}
+        if csvStat is not None:
+            meta["csv"] = {"mtime": csvStat.st_mtime_ns, "size": csvStat.st_size}
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap = True):
+        '''
+        Load a pool written by save, memory mapping the arrays unless mmap = False
+        '''
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        stops = np.load(os.path.join(path, "stops.npy"), mmap_mode = mode)
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode = mode)
+        columns = {name: np.load(os.path.join(path, "column_" + name + ".npy"), mmap_mode = mode) for name in meta["columns"]}
+        pool = cls(meta["stores"], stops, offsets, columns, meta["categories"])
+        pool.meta = meta
+        return pool
+
+def _PoolPath(path):
+    return path + ".routes"
+
+def WriteRoutes(routeData, path):
+    '''
+    Save a route dataframe as csv (for compatibility) plus its compact binary pool alongside
+    '''
+    with tracer.stage("csv.write", path = path, routes = len(routeData)):
+        routeData.to_csv(path, index = False)
+        try:
+            CompactRoutePool.from_frame(routeData).save(_PoolPath(path), os.stat(path))
+        except OSError:
+            pass
+
+def ReadRoutes(path, compact = False):
+    '''
+    Read routes saved with WriteRoutes (or any Route/Cost csv). The binary pool is used while it
+    matches the csv, otherwise the csv is parsed with literal_eval and the binary pool rewritten.
+
+    Inputs
+    ------
+    path : string
+    Path to the csv e.g. "Data" + sep + "Routes" + sep + "generatedRoutesMonday.csv"
+
+    compact : boolean
+    True to return the CompactRoutePool instead of a dataframe
+
+    Returns
+    -------
+    routeData : pd.DataFrame/CompactRoutePool
+    '''
+    with tracer.stage("csv.read", path = path):
+        stat = os.stat(path)
+        try:
+            pool = CompactRoutePool.load(_PoolPath(path))
+            csv = pool.meta.get("csv", {})
+            if csv.get("mtime") != stat.st_mtime_ns or csv.get("size") != stat.st_size:
+                pool = None
+        except (OSError, ValueError, KeyError):
+            pool = None
+
+        if pool is None:
+            pool = CompactRoutePool.from_frame(pd.read_csv(path, converters = {"Route": literal_eval}))
+            try:
+                pool.save(_PoolPath(path), stat)
+            except OSError:
+                pass
+
+    return pool if compact else pool.to_frame()
+
+def ReadWeekRoutes(paths, days):
+    '''
+    Read the route pools of several days into one CompactRoutePool with a Day column
+    '''
+    return CompactRoutePool.concat([ReadRoutes(path, compact = True) for path in paths], key = "Day", labels = days)
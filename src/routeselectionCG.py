@@ -0,0 +1,206 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from RouteGenKCI import CachedCheapestInsertion
+from routeselectionV1 import RouteIncidence
+from routeselectionV2 import RouteSelectionV2
+from traveltimes import TravelTimeMatrix
+
+def MasterLP(routes, costs, nodes):
+    '''
+    Solves the LP relaxation of the RouteSelectionV2 set partitioning model
+
+    Inputs:
+    -------
+    routes : list
+        routes (lists of store names), each one is both a Foodstuffs truck and a Mainfreight column
+    costs : list
+        time in seconds of each route
+    nodes : list
+        all the stores that must be covered exactly once
+
+    Outputs:
+    -------
+    obj : float
+        LP objective in dollars
+    pi : np.array
+        dual of each store's coverage constraint
+    mu : float
+        dual of the total number of trucks constraint (<= 0)
+    '''
+    N = len(routes)
+    incidence = RouteIncidence(routes, nodes)
+
+    # Foodstuffs truck columns then Mainfreight columns, as in RouteSelectionV2
+    c = np.r_[np.asarray(costs, dtype = float)*(150/3600), np.full(N, 1200.0)]
+    A_eq = sp.hstack([incidence, incidence], format = "csr")
+    A_ub = sp.csr_matrix(np.r_[np.ones(N), np.zeros(N)][None, :])
+
+    res = linprog(c, A_ub = A_ub, b_ub = [20], A_eq = A_eq, b_eq = np.ones(len(nodes)), bounds = (0, 1), method = "highs")
+    if res.status != 0:
+        raise RuntimeError("Route selection LP relaxation failed: " + res.message)
+    return res.fun, res.eqlin.marginals, res.ineqlin.marginals[0]
+
+def PriceRoutes(pi, mu, nodes, demand, weights, centralNode = 'Warehouse', tol = 1e-6, improve = True):
+    '''
+    Capacity constrained insertion heuristic that looks for routes with negative reduced cost
+
+    Inputs:
+    -------
+    pi, mu
+        duals from MasterLP
+    nodes : list
+        stores, same order as pi
+    demand : dict
+        store -> demand (pallets)
+    weights : TravelTimeMatrix
+        travel times between stores
+    improve : boolean
+        cost node sets like RegionRouteConstruction(..., improve), i.e. with 2-opt/Or-opt
+
+    Outputs:
+    -------
+    newRoutes : list
+        (route, cost) pairs whose Foodstuffs or Mainfreight column prices out negative
+
+    Notes:
+    ------
+    Starting from every store with a positive dual, stores are inserted greedily at their
+    cheapest position while the route stays within 12 pallets and 14400s. Foodstuffs pricing
+    trades each store's dual against its extra driving/unloading cost, Mainfreight pricing
+    (flat $1200) just packs in the highest duals. Every node set met along the way is re-costed
+    with CheapestInsertion so new routes are costed exactly like generated ones.
+    '''
+    W = weights.W
+    central = weights.index[centralNode]
+    storeIdx = weights.indices(nodes)
+    d = np.array([demand[node] for node in nodes], dtype = float)
+    positive = np.flatnonzero(pi > tol)
+
+    candidateSets = set()
+    for seed in positive[np.argsort(-pi[positive], kind = "stable")]:
+        for rate in (150/3600, 0.0):
+            tour = [central, storeIdx[seed], central]
+            inRoute = np.zeros(len(nodes), dtype = bool)
+            inRoute[seed] = True
+            load = d[seed]
+            duration = W[central, storeIdx[seed]] + W[storeIdx[seed], central] + 300
+            candidateSets.add(frozenset(np.flatnonzero(inRoute)))
+            while True:
+                candidates = positive[~inRoute[positive] & (load + d[positive] <= 12)]
+                if len(candidates) == 0:
+                    break
+                t = np.asarray(tour)
+                left, right = t[:-1], t[1:]
+                cand = storeIdx[candidates]
+                # delta[k, i] is the extra travel time of inserting candidates[k] between positions i and i+1
+                delta = W[np.ix_(left, cand)].T + W[np.ix_(cand, right)] - W[left, right]
+                best = np.argmin(delta, axis = 1)
+                bestDelta = delta[np.arange(len(cand)), best]
+                feasible = duration + bestDelta + 300 < 14400
+                gain = np.where(feasible, pi[candidates] - rate*(bestDelta + 300), -np.inf)
+                k = int(np.argmax(gain))
+                if gain[k] <= tol:
+                    break
+                tour.insert(int(best[k]) + 1, cand[k])
+                inRoute[candidates[k]] = True
+                load += d[candidates[k]]
+                duration += bestDelta[k] + 300
+                candidateSets.add(frozenset(np.flatnonzero(inRoute)))
+
+    newRoutes = []
+    for nodeSet in candidateSets:
+        members = [nodes[i] for i in sorted(nodeSet)]
+        finalTour, finalTourWeight = CachedCheapestInsertion(members, weights, centralNode = centralNode, improve = improve)
+        # Add time it takes to unload per supermarket
+        finalTourWeight += 300*(len(finalTour)-2)
+        if finalTourWeight >= 14400:
+            continue
+        dualValue = pi[sorted(nodeSet)].sum()
+        reducedCost = min(finalTourWeight*(150/3600) - dualValue - mu, 1200 - dualValue)
+        if reducedCost < -tol:
+            newRoutes.append((finalTour, finalTourWeight))
+    return newRoutes
+
+def RouteSelectionCG(nodes, demand, weights, seedRoutes = None, maxIterations = 100, backend = None, improve = True):
+    """
+    Select the best routes by column generation: solve the LP relaxation of the RouteSelectionV2
+    model, price new routes from the store duals, repeat until no route prices out and then solve
+    the integer master over the generated routes
+
+    Inputs:
+    -------
+    nodes : list
+        a list of all the stores that must be delivered to
+
+    demand : dict
+        store -> demand (pallets) on the day being planned
+
+    weights : TravelTimeMatrix/pd.DataFrame
+        travel times between stores
+
+    seedRoutes : pd.DataFrame
+        optional starting pool (Route/Cost), one single store route per store is always added
+        so the master is feasible
+
+    maxIterations : integer
+        cap on the number of pricing rounds
+
+    backend : string
+        solver backend for the integer master (see solvers.Solve)
+
+    improve : boolean
+        improve the priced tours with 2-opt/Or-opt, as for RoutePool
+
+    Outputs:
+    -------
+    routeDataLP, obj
+        as for RouteSelectionV2, over the generated pool
+    """
+    if not isinstance(weights, TravelTimeMatrix):
+        weights = TravelTimeMatrix.from_frame(weights)
+
+    routes, costs = [], []
+    seen = {}
+
+    def AddRoute(route, cost):
+        # One column per store set, at the cheapest cost seen for it. Returns True if the pool changed
+        key = frozenset(route)
+        if key not in seen:
+            seen[key] = len(routes)
+            routes.append(list(route))
+            costs.append(cost)
+            return True
+        i = seen[key]
+        if cost < costs[i]:
+            routes[i] = list(route)
+            costs[i] = cost
+            return True
+        return False
+
+    if seedRoutes is not None:
+        for route, cost in zip(seedRoutes['Route'], seedRoutes['Cost']):
+            AddRoute(route, cost)
+    for node in nodes:
+        finalTour, finalTourWeight = CachedCheapestInsertion([node], weights, centralNode = 'Warehouse', improve = improve)
+        AddRoute(finalTour, finalTourWeight + 300)
+
+    for iteration in range(maxIterations):
+        obj, pi, mu = MasterLP(routes, costs, nodes)
+        newRoutes = PriceRoutes(pi, mu, nodes, demand, weights, improve = improve)
+        added = len(routes)
+        changed = sum(AddRoute(route, cost) for route, cost in newRoutes)
+        print(f"Column generation iteration {iteration}: LP = {obj:.2f}, {len(routes) - added} routes added, "
+              f"{changed - (len(routes) - added)} made cheaper")
+        if changed == 0:
+            break
+
+    # Integer master over the generated pool
+    routeData = pd.DataFrame({'Route': pd.Series(routes), 'Cost': pd.Series(costs)})
+    return RouteSelectionV2(routeData, nodes, backend)
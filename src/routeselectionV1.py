@@ -4,11 +4,43 @@
 #
 ####################################################################################
 import numpy as np
-import random
-import pandas as pd
-from pulp import *
+import scipy.sparse as sp
+from solvers import BinaryModel, Solve
+from instrument import tracer
 
-def RouteSelection(routeData, nodes):
+def RouteIncidence(routes, nodes):
+    """
+    Builds the store x route incidence matrix in a single pass over the routes
+
+    Inputs:
+    -------
+    routes : list/pd.Series
+        routes, each one a list of store names
+
+    nodes : list
+        the stores making up the rows, stores not in nodes (e.g. the Warehouse) are ignored
+
+    Outputs:
+    -------
+    incidence : scipy.sparse.csr_matrix
+        incidence[s, r] = 1 if store nodes[s] is on route r
+    """
+    position = {node: i for i, node in enumerate(nodes)}
+    rows = []
+    cols = []
+    for j, route in enumerate(routes):
+        for store in route:
+            i = position.get(store)
+            if i is not None:
+                rows.append(i)
+                cols.append(j)
+    incidence = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape = (len(nodes), len(routes)))
+    # A store visited twice on a route still only covers it once
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+    return incidence
+
+def RouteSelection(routeData, nodes, backend = None, writeLP = False):
     """
     Select the best routes to minimise the cost of transporting pallets to supermarket 
 
@@ -25,6 +57,12 @@ def RouteSelection(routeData, nodes):
     node : list
         a list of all the nodes in the network 
 
+    backend : string
+        solver backend, "highs" (in-process, default) or "pulp" (see solvers.Solve)
+
+    writeLP : boolean
+        debug option, True to write the model to RouteSelection.lp
+
     Outputs:
     -------
     routeDataLP: pd.DataFrame
@@ -42,47 +80,27 @@ def RouteSelection(routeData, nodes):
 
     cost = routeData['Cost'].tolist()
 
-    prob = LpProblem("RouteSelection", LpMinimize)
-
-    # Create binary variables
-    routeVars = LpVariable.dicts("route", routeIdx, 0, cat = "Binary")
-
     # Objective function: minimise the cost of traversing routes 
-    prob.setObjective(LpAffineExpression([(routeVars[i], cost[i]) for i in routeIdx]))
-    # prob += lpSum([cost[i] * routeVars[i] for i in routeIdx]), "Total Cost of Traversing Routes"
+    prob = BinaryModel(cost, "RouteSelection", varName = "route")
 
     # Constraints: 
     # Form constraint for each node i.e. sum of all routes passing through node = 1
-    for node in nodes:
-        prob += lpSum([routeVars[i] for i in routeIdx if (node in routeData.iloc[i]['Route'])]) == 1, node
-        # prob += lpSum([1 * routeVars[i] if node in routeData['Route'][i] else 0 * routeVars[i] for i in routeIdx]) == 1, node
+    prob.addRows(RouteIncidence(routeData['Route'], nodes), 1, 1, names = nodes)
 
     # Form constraint for total number of trucks 
-    prob += lpSum([1 * routeVars[i] for i in routeIdx]) <= 20, "Total Number of Trucks"
-
-    # The problem data is written to an .lp file
-    prob.writeLP("RouteSelection.lp")
+    prob.addRows(np.ones(len(routeIdx)), upper = 20, names = ["Total Number of Trucks"])
 
-    # The problem is solved using PuLP's choice of Solver
-    prob.solve()
+    # The problem is solved in-process (or with PuLP's choice of Solver), writing the .lp file is opt-in
+    with tracer.stage("selection", model = "RouteSelection", routes = len(routeData)):
+        status, routeLpVarsValueSorted, obj = Solve(prob, backend, writeLP)
 
     # The status of the solution is printed to the screen
-    print("Status:", LpStatus[prob.status])
-
-    # Each of the variables is printed with it's resolved optimum value
-    routeLpVars = []
-    routeLpVarsValue = []
-    for v in prob.variables():
-        routeLpVars.append(v.name)
-        routeLpVarsValue.append(v.varValue)
+    print("Status:", status)
 
-    # Sort puLP variables and their corresponding values into order 
-    idx = sorted(range(len(routeLpVars)), key = lambda k: int(routeLpVars[k].split('_')[1]))
-    routeLpVarsSorted = [routeLpVars[i] for i in idx]
-    routeLpVarsValueSorted = [routeLpVarsValue[i] for i in idx]
+    # Variables are indexed by route so no need to sort them by name
+    routeLpVarsSorted = ["route_" + str(i) for i in routeIdx]
 
     # The optimised objective function value is printed to the screen
-    obj = value(prob.objective)
     print("Total Cost of Traversing Routes =", obj)
 
     # Put solution into a data frame 
@@ -6,9 +6,12 @@
 import numpy as np
 import random
 import pandas as pd
-from pulp import *
+import scipy.sparse as sp
+from solvers import BinaryModel, Solve
+from routeselectionV1 import RouteIncidence
+from instrument import tracer
 
-def RouteSelectionV2(routeData, nodes):
+def RouteSelectionV2(routeData, nodes, backend = None, writeLP = False, trucks = 20):
     """
     Select the best routes to minimise the cost of transporting pallets to supermarket 
 
@@ -25,6 +28,15 @@ def RouteSelectionV2(routeData, nodes):
     node : list
         a list of all the nodes in the network 
 
+    backend : string
+        solver backend, "highs" (in-process, default) or "pulp" (see solvers.Solve)
+
+    writeLP : boolean
+        debug option, True to write the model to RouteSelection.lp
+
+    trucks : integer
+        number of Foodstuffs trucks available
+
     Outputs:
     -------
     routeDataLP: pd.DataFrame
@@ -48,47 +60,30 @@ def RouteSelectionV2(routeData, nodes):
     routeDataDupli['CostDolllars'] = costDollars
     routeIdx = list(routeDataDupli.index) 
 
-    prob = LpProblem("RouteSelection", LpMinimize)
-
-    # Create binary variables
-    routeVars = LpVariable.dicts("route", routeIdx, 0, cat = "Binary")
-
     # Objective function: minimise the cost of traversing routes 
-    prob.setObjective(LpAffineExpression([(routeVars[i], costDollars[i]) for i in routeIdx]))
-    # prob += lpSum([cost[i] * routeVars[i] for i in routeIdx]), "Total Cost of Traversing Routes"
+    prob = BinaryModel(costDollars, "RouteSelection", varName = "route")
 
     # Constraints: 
     # Form constraint for each node i.e. sum of all routes passing through node = 1
-    for node in nodes:
-        prob += lpSum([routeVars[i] for i in routeIdx if (node in routeDataDupli.iloc[i]['Route'])]) == 1, node
-        # prob += lpSum([1 * routeVars[i] if node in routeData['Route'][i] else 0 * routeVars[i] for i in routeIdx]) == 1, node
+    # (the incidence is built once and shared by the Foodstuffs and Mainfreight copies)
+    incidence = RouteIncidence(routeData['Route'], nodes)
+    prob.addRows(sp.hstack([incidence, incidence]), 1, 1, names = nodes)
 
     # Form constraint for total number of trucks 
-    prob += lpSum([1 * routeVars[i] for i in list(routeData.index)]) <= 20, "Total Number of Trucks"
-
-    # The problem data is written to an .lp file
-    prob.writeLP("RouteSelection.lp")
+    # (only the first copy of each route is a Foodstuffs truck, the second is Mainfreight)
+    prob.addRows(np.r_[np.ones(len(routeData)), np.zeros(len(routeData))], upper = trucks, names = ["Total Number of Trucks"])
 
-    # The problem is solved using PuLP's choice of Solver
-    prob.solve()
+    # The problem is solved in-process (or with PuLP's choice of Solver), writing the .lp file is opt-in
+    with tracer.stage("selection", model = "RouteSelectionV2", routes = len(routeData)):
+        status, routeLpVarsValueSorted, obj = Solve(prob, backend, writeLP)
 
     # The status of the solution is printed to the screen
-    print("Status:", LpStatus[prob.status])
-
-    # Each of the variables is printed with it's resolved optimum value
-    routeLpVars = []
-    routeLpVarsValue = []
-    for v in prob.variables():
-        routeLpVars.append(v.name)
-        routeLpVarsValue.append(v.varValue)
+    print("Status:", status)
 
-    # Sort puLP variables and their corresponding values into order 
-    idx = sorted(range(len(routeLpVars)), key = lambda k: int(routeLpVars[k].split('_')[1]))
-    routeLpVarsSorted = [routeLpVars[i] for i in idx]
-    routeLpVarsValueSorted = [routeLpVarsValue[i] for i in idx]
+    # Variables are indexed by route so no need to sort them by name
+    routeLpVarsSorted = ["route_" + str(i) for i in routeIdx]
 
     # The optimised objective function value is printed to the screen
-    obj = value(prob.objective)
     print("Total Cost of Traversing Routes =", obj)
 
     # Put solution into a data frame 
@@ -0,0 +1,222 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import numpy as np
+from scipy import stats
+
+class RunningStats:
+    '''
+    Welford mean/variance accumulator, batches are merged with Chan's parallel update so
+    memory stays constant however many values are added
+
+    Attributes
+    ----------
+    n : int
+    Number of values seen
+
+    mean : float
+    Running mean
+
+    M2 : float
+    Running sum of squared deviations from the mean
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype = float).ravel()
+        m = len(values)
+        if m == 0:
+            return
+        batchMean = values.mean()
+        batchM2 = ((values - batchMean)**2).sum()
+        total = self.n + m
+        delta = batchMean - self.mean
+        self.mean += delta*m/total
+        self.M2 += batchM2 + delta**2*self.n*m/total
+        self.n = total
+
+    @property
+    def variance(self):
+        return self.M2/(self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def halfWidth(self, alpha = 0.05):
+        '''
+        Half width of the t confidence interval for the mean
+        '''
+        if self.n < 2:
+            return np.inf
+        return stats.t.ppf(1 - alpha/2, self.n - 1)*self.std/np.sqrt(self.n)
+
+    def confint(self, alpha = 0.05):
+        '''
+        t confidence interval for the mean, same as DescrStatsW(values).tconfint_mean(alpha)
+        '''
+        h = self.halfWidth(alpha)
+        return self.mean - h, self.mean + h
+
+class TDigest:
+    '''
+    Merging t-digest (Dunning & Ertl 2019) of a stream of values. Each batch is sorted in with the
+    current centroids and merged back down under the k1 scale function, all in numpy, so memory
+    stays below compression/2 centroids and every quantile is read off the same digest
+
+    Inputs
+    ------
+    compression : float
+    Accuracy/size trade off, larger keeps more (smaller) centroids. Centroids are smallest in
+    the tails so extreme quantiles stay accurate.
+    '''
+
+    def __init__(self, compression = 1000):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype = float).ravel()
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(len(values))])
+        order = np.argsort(means, kind = "stable")
+        means, weights = means[order], weights[order]
+
+        # Centroids whose left edge falls in the same unit of k1(q) = compression/(2 pi)*arcsin(2q - 1) are merged
+        left = (np.cumsum(weights) - weights)/self.n
+        k = np.floor(self.compression/(2*np.pi)*np.arcsin(np.clip(2*left - 1, -1, 1)))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means*weights, starts)/self.weights
+
+    def quantile(self, p):
+        '''
+        Estimate of the p quantile, interpolating between centroid centres (and the exact min/max)
+        '''
+        if self.n == 0:
+            return np.nan
+        centres = np.cumsum(self.weights) - self.weights/2
+        return float(np.interp(p*self.n, np.r_[0, centres, self.n], np.r_[self.min, self.means, self.max]))
+
+class StreamingHistogram:
+    '''
+    Fixed bin histogram, the bins cover [lower, upper) and anything outside is only counted
+
+    Inputs
+    ------
+    lower, upper : float
+    Range of the bins, taken (with 10% padding) from the first batch if not given
+
+    bins : int
+    Number of bins
+    '''
+
+    def __init__(self, lower = None, upper = None, bins = 100):
+        self.bins = bins
+        self.edges = None if lower is None or upper is None else np.linspace(lower, upper, bins + 1)
+        self.counts = np.zeros(bins, dtype = np.int64)
+        self.under = 0
+        self.over = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype = float).ravel()
+        if len(values) == 0:
+            return
+        if self.edges is None:
+            lower, upper = values.min(), values.max()
+            pad = 0.1*(upper - lower) or 1.0
+            self.edges = np.linspace(lower - pad, upper + pad, self.bins + 1)
+        lower, upper = self.edges[0], self.edges[-1]
+        self.under += int((values < lower).sum())
+        self.over += int((values >= upper).sum())
+        inside = values[(values >= lower) & (values < upper)]
+        idx = np.minimum(((inside - lower)/(upper - lower)*self.bins).astype(np.int64), self.bins - 1)
+        self.counts += np.bincount(idx, minlength = self.bins)
+
+    def density(self):
+        '''
+        Bin heights normalised like plt.hist(..., density = True) over the binned values
+        '''
+        total = self.counts.sum()
+        return self.counts/(total*np.diff(self.edges)) if total else np.zeros(self.bins)
+
+    def plot(self, ax, **kwargs):
+        '''
+        Draw the histogram on a matplotlib axis
+        '''
+        return ax.stairs(self.density(), self.edges, fill = True, **kwargs)
+
+class SimulationSummary:
+    '''
+    Everything RunSimulation reports about a stream of scenario costs: running mean/variance,
+    t-digest quantiles and a fixed bin histogram
+
+    Every update is taken as one independent replicate (e.g. a simulate_until block with its own
+    random stream, and its own design for antithetic/LHS/Sobol sampling) and the confidence
+    interval for the mean comes from the spread of the replicate means. That interval is valid
+    whatever the sampling scheme and narrows with any variance reduction it gives, which the
+    s^2/n interval over individual costs does not. Updates should all be the same size.
+
+    Inputs
+    ------
+    quantiles : tuple
+    Quantiles to report, by default the median and the 95% prediction interval
+
+    bins : int
+    Number of histogram bins
+    '''
+
+    def __init__(self, quantiles = (0.025, 0.5, 0.975), bins = 100):
+        self.moments = RunningStats()
+        self.replicates = RunningStats()
+        self.quantiles = tuple(quantiles)
+        self.digest = TDigest()
+        self.histogram = StreamingHistogram(bins = bins)
+
+    @property
+    def n(self):
+        return self.moments.n
+
+    def update(self, values):
+        values = np.asarray(values, dtype = float).ravel()
+        if len(values) == 0:
+            return
+        self.moments.update(values)
+        self.replicates.update([values.mean()])
+        self.digest.update(values)
+        self.histogram.update(values)
+
+    def halfWidth(self, alpha = 0.05):
+        '''
+        Half width of the t confidence interval for the mean over the replicate means
+        '''
+        return self.replicates.halfWidth(alpha)
+
+    def confint(self, alpha = 0.05):
+        h = self.halfWidth(alpha)
+        return self.moments.mean - h, self.moments.mean + h
+
+    def quantile(self, p):
+        return self.digest.quantile(p)
+
+    def report(self, alpha = 0.05):
+        lower, upper = self.confint(alpha)
+        return {"n": self.n, "replicates": self.replicates.n, "mean": float(self.moments.mean), "std": float(self.moments.std),
+                "ciLower": float(lower), "ciUpper": float(upper),
+                "quantiles": {p: self.quantile(p) for p in self.quantiles}}
@@ -10,7 +10,14 @@ import random
 import pandas as pd
 from os import sep
 from DataAnalysis import *
+from traveltimes import TravelTimeMatrix
+from simstats import SimulationSummary
+from stores import StoreRegistry, storeTypes
 import time
+import warnings
+from scipy.stats import qmc
+from concurrent.futures import ProcessPoolExecutor
+from instrument import tracer
 
 def generate_distribution_value(minimum, maximum):
     ''' Generates a route time from a set distribution, in order to simulate the time
@@ -30,33 +37,111 @@ def generate_distribution_value(minimum, maximum):
     choice = random.uniform(0,1)
     return minimum + tol*choice
 
-def generate_time_values(weekend=False):
+def generate_time_values(weekend=False, timeData=None):
     ''' Generates one possbile set of times to work with for route generation.
 
     Inputs:
         weekend: bool
             true/false depending on if we wish to generate times for the weekend.
             assigns max multiplier different times if we wish
+        timeData: TravelTimeMatrix
+            travel times to perturb. loaded (through the binary cache) if not given.
 
     Outputs:
         times: dataframe
             one set of variable times from which to sample from.
     '''
-    # Assigning multipliers to different day scenarios
-    mn = 1                  # min multiplier is best case scenario - no traffic
-    if weekend: ma = 1.5
-    else: ma = 2
-
     # Import travel times between supermarkets
-    timeData = pd.read_csv("Data" + sep + "FoodstuffTravelTimes.csv", index_col = 0)
+    if timeData is None:
+        timeData = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv")
+
+    # Every arc gets its own multiplier, min is best case scenario - no traffic
+    W = generate_time_matrices(1, weekend=weekend, timeData=timeData, rng=np.random.default_rng(random.getrandbits(64)))[0]
+    return TravelTimeMatrix(W, timeData.stores, timeData.version).to_frame()
+
+# (min, max) travel time multiplier of each shift, keyed by (weekend, shift). shift None is the
+# whole day range generate_time_values has always used, the others match simulate's routes
+shiftMultipliers = {(False, None): (1, 2), (True, None): (1, 1.5),
+                    (False, "morning"): (1, 2), (False, "afternoon"): (1, 1.5),
+                    (True, "morning"): (1, 1.25), (True, "afternoon"): (1, 1.4)}
+
+def generate_time_matrices(K, weekend=False, shift=None, timeData=None, rng=None):
+    ''' Generates K traffic perturbed travel time matrices at once, every arc scaled by its own
+    uniform multiplier from the shift's range.
+
+    Inputs:
+        K: int
+            number of matrices
+        weekend: bool
+            true/false depending on if we wish to generate times for the weekend.
+        shift: string
+            "morning", "afternoon" or None for the whole day range (see shiftMultipliers)
+        timeData: TravelTimeMatrix
+            travel times to perturb. loaded (through the binary cache) if not given.
+        rng: np.random.Generator
+            source of the multipliers, a fresh default_rng() if None.
+
+    Outputs:
+        matrices: np.array
+            (K x n x n) with matrices[k] laid out like timeData.W
+    '''
+    if timeData is None:
+        timeData = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv")
+    if rng is None:
+        rng = np.random.default_rng()
+    mn, ma = shiftMultipliers[(weekend, shift)]
+    W = np.asarray(timeData.W)
+    return W*(mn + (ma - mn)*rng.random((K,) + W.shape))
+
+def route_arcs(routes, timeData):
+    ''' Arcs of every route as gathered index arrays.
+
+    Inputs:
+        routes: DataFrame/list
+            routes (lists of store names starting and ending at the Warehouse)
+        timeData: TravelTimeMatrix
+            travel times the store names index into
+
+    Outputs:
+        start, end: np.array
+            matrix indices of the two ends of every arc, routes back to back
+        offsets: np.array
+            route i owns arcs offsets[i]:offsets[i+1]
+    '''
+    if isinstance(routes, pd.DataFrame):
+        routes = routes['Route']
+    stops = [timeData.indices(route) for route in routes]
+    offsets = np.zeros(len(stops) + 1, dtype = np.int64)
+    np.cumsum([max(len(s) - 1, 0) for s in stops], out = offsets[1:])
+    start = np.concatenate([s[:-1] for s in stops]) if stops else np.empty(0, dtype = np.intp)
+    end = np.concatenate([s[1:] for s in stops]) if stops else np.empty(0, dtype = np.intp)
+    return start, end, offsets
+
+def recost_routes(routes, matrices, timeData, unload=300):
+    ''' Re-costs routes against a batch of travel time matrices.
 
-    # Iterating through index for the problem
-    indices = timeData.index
-    for index1,index2 in zip(indices[::-1],indices[-1::]): # TODO: assess if this is correct iteration approach. runs so it will do for now.
-        value = timeData[index1][index2]
-        timeData[index1][index2] = generate_distribution_value(mn*value,ma*value)
+    Inputs:
+        routes: DataFrame/list
+            routes to cost
+        matrices: np.array
+            (K x n x n) travel times, e.g. from generate_time_matrices
+        timeData: TravelTimeMatrix
+            store name -> matrix index
+        unload: float
+            seconds spent unloading at each store
 
-    return timeData
+    Outputs:
+        times: np.array
+            (K x routes) time in seconds of every route under every matrix, costed like the
+            Cost column of the route pools (travel plus unloading)
+    '''
+    start, end, offsets = route_arcs(routes, timeData)
+    arcTimes = matrices[:, start, end]
+    # Sum each route's arcs, cumsum keeps routes without arcs at zero
+    cumulative = np.concatenate([np.zeros((len(matrices), 1)), np.cumsum(arcTimes, axis = 1)], axis = 1)
+    travel = cumulative[:, offsets[1:]] - cumulative[:, offsets[:-1]]
+    stores = np.maximum(np.diff(offsets) - 1, 0)
+    return travel + unload*stores
 
 def setupbootstrap(demandData,wknd=False):
     ''' Initialises lists for bootstrapping
@@ -124,7 +209,7 @@ def bootstrap(fsSamp, pkSamp, nwSamp):
 
     return demands
 
-def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
+def simulate(routes, registry, fsSamp, pkSamp, nwSamp, wknd=False):
     ''' Extracts data as DataFrame of demands. Then, samples the data for each store chain,
     depending on whether or not it is the weekend. The demands are then simulated along with times
     in order to generate a range of optimal solutions.
@@ -134,6 +219,8 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
         Whether or not we wish to model weekend demand on Saturday.
     routes: DataFrame
         Containing costs for each route in the optimal solution.
+    registry: StoreRegistry
+        Store types, build it once (StoreRegistry(locationData)) and reuse it for every run.
 
     Outputs:
     opt: float
@@ -142,7 +229,7 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
     '''
 
     # First getting our demands from bootstrap distribution
-    demands = bootstrap(fsSamp,nwSamp,pkSamp)
+    demands = bootstrap(fsSamp,pkSamp,nwSamp)
 
     # We now split routes into morning and afternoon to account for different weights
     morning = []
@@ -167,7 +254,7 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
             # Checking demand with input dict
             #demand = 0
             for store in route[1]['Route'][1:-1]:
-                store_type = locationData.loc[locationData["Supermarket"] == store, "Type"].values[0]
+                store_type = registry.type_of(store)
                 demandtoadd = demands[store_type][0]
                 demand += demandtoadd # TODO: refactor by store type in the optimal solution
 
@@ -183,7 +270,7 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
             # Checking demand with input dict
             demand = 0
             for store in route[1]['Route'][1:-1]:
-                store_type = locationData.loc[locationData["Supermarket"] == store, "Type"].values[0]
+                store_type = registry.type_of(store)
                 demandtoadd = demands[store_type][0]
                 demand += demandtoadd # TODO: refactor by store type in the optimal solution
 
@@ -201,7 +288,7 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
             # Checking demand with input dict
             demand = 0
             for store in route[1]['Route'][1:-1]:
-                store_type = locationData.loc[locationData["Supermarket"] == store, "Type"].values[0]
+                store_type = registry.type_of(store)
                 demandtoadd = demands[store_type][0]
                 demand += demandtoadd # TODO: refactor by store type in the optimal solution
 
@@ -217,7 +304,7 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
             # Checking demand with input dict
             demand = 0
             for store in route[1]['Route'][1:-1]:
-                store_type = locationData.loc[locationData["Supermarket"] == store, "Type"].values[0]
+                store_type = registry.type_of(store)
                 demandtoadd = demands[store_type][0]
                 demand += demandtoadd # TODO: refactor by store type in the optimal solution
 
@@ -228,3 +315,371 @@ def simulate(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False):
     return opt
 
 
+
+def route_type_counts(routes, locationData):
+    ''' Precomputes what simulate looks up on every run: the cost of each route and how many
+    stores of each type it visits.
+
+    Inputs:
+    routes: DataFrame
+        Route/Cost of each route in the optimal solution.
+    locationData: DataFrame/StoreRegistry
+        Supermarket/Type of every store.
+
+    Outputs:
+    costs: np.array
+        time in seconds of each route
+    counts: np.array
+        (routes x 3) number of Four Square, Pak 'n Save and New World stores on each route
+    '''
+    registry = locationData if isinstance(locationData, StoreRegistry) else StoreRegistry(locationData)
+    counts = np.zeros((len(routes), len(registry.typeNames)))
+    for i, route in enumerate(routes['Route']):
+        np.add.at(counts[i], registry.typeCode[registry.ids(route[1:-1])], 1)
+    counts = counts[:, :len(storeTypes)]
+    costs = routes['Cost'].to_numpy(dtype = float)
+    return costs, counts
+
+def simulate_batch(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False, n=1000, rng=None, chunk=100000, sampling="iid"):
+    ''' Vectorised version of simulate, evaluates n scenarios at once.
+
+    Inputs:
+    routes: DataFrame
+        Containing costs for each route in the optimal solution.
+    locationData: DataFrame
+        Store types, used once to count the store types on each route.
+    fsSamp, pkSamp, nwSamp: list
+        Demand samples for each store type (see setupbootstrap).
+    wknd: Bool
+        Whether or not we wish to model weekend demand on Saturday.
+    n: int
+        Number of scenarios.
+    rng: np.random.Generator
+        Source of the random numbers, a fresh default_rng() if None.
+    chunk: int
+        Scenarios drawn at a time, bounds memory at about chunk x routes floats.
+    sampling: string
+        Sampling scheme of the demand and time uniforms, see draw_uniforms. The stratified
+        schemes are stratified within each chunk.
+
+    Outputs:
+    opt: np.array
+        optimal solution value for each of the n scenarios
+
+    Notes:
+        Same cost model as simulate: alternate routes are morning/afternoon with their own
+        time multipliers, overtime past 4 hours is charged at $200/h and Mainfreight is charged
+        on the demand of the last route (accumulated over the morning routes on Saturday when
+        there are no afternoon routes).
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    costs, tol, last = _route_arrays(routes, locationData, wknd)
+    samples = [np.asarray(s, dtype = float) for s in (fsSamp, pkSamp, nwSamp)]
+
+    opt = np.empty(n)
+    for start in range(0, n, chunk):
+        m = min(chunk, n - start)
+        U = draw_uniforms(m, len(storeTypes) + len(costs), rng, sampling)
+        opt[start:start+m] = _scenario_costs(costs, tol, last, samples, U)
+    return opt
+
+def _route_arrays(routes, locationData, wknd):
+    # Route costs, time multiplier spread and the store type counts Mainfreight is charged on
+    costs, counts = route_type_counts(routes, locationData)
+
+    # Max multiplier of each route, min is always 1 (no traffic)
+    morning = np.arange(len(costs)) % 2 == 0
+    if wknd: multiplier = np.where(morning, 1.25, 1.4)
+    else: multiplier = np.where(morning, 2, 1.5)
+    tol = multiplier*costs - costs
+
+    # Demand that simulate charges Mainfreight on, as a combination of the route type counts
+    if len(costs) == 0: last = np.zeros(len(storeTypes))
+    elif (~morning).any(): last = counts[np.flatnonzero(~morning)[-1]]
+    elif wknd: last = counts[morning].sum(axis = 0)
+    else: last = counts[np.flatnonzero(morning)[-1]]
+    return costs, tol, last
+
+def _scenario_costs(costs, tol, last, samples, U):
+    # U[:, :3] pick the Four Square/Pak 'n Save/New World demand samples, U[:, 3:] the route times
+    k = len(samples)
+    time = (costs + tol*U[:, k:k+len(costs)])/3600
+    return _schedule_costs(time, _draw_demands(samples, U), last)
+
+def _draw_demands(samples, U):
+    return np.column_stack([s[np.minimum((U[:, k]*len(s)).astype(np.int64), len(s) - 1)] for k, s in enumerate(samples)])
+
+def _schedule_costs(time, demands, last):
+    # Route times in hours -> overtime aware driver cost plus Mainfreight on the last route's demand
+    routeCost = np.where(time > 4, 150*4 + (time-4)*200, 150*time)
+    demand = demands @ last
+    return routeCost.sum(axis = 1) + ((demand-20*12)%12)*1200
+
+# Sampling schemes understood by draw_uniforms
+samplingModes = ["iid", "antithetic", "lhs", "sobol"]
+
+def draw_uniforms(m, d, rng, sampling="iid"):
+    ''' Draws m points in the d dimensional unit cube.
+
+    Inputs:
+    m, d: int
+        Number of points and dimensions.
+    rng: np.random.Generator
+        Source of randomness (also seeds the scrambling of the quasi-random schemes).
+    sampling: string
+        "iid"        independent uniforms
+        "antithetic" pairs u, 1 - u (rows 2i and 2i+1)
+        "lhs"        Latin hypercube, every dimension stratified into m equal strata
+        "sobol"      scrambled Sobol sequence
+
+    Outputs:
+    U: np.array
+        (m x d) uniforms
+    '''
+    if sampling == "iid":
+        return rng.random((m, d))
+    if sampling == "antithetic":
+        half = rng.random(((m + 1)//2, d))
+        return np.stack([half, 1 - half], axis = 1).reshape(-1, d)[:m]
+    if sampling == "lhs":
+        return qmc.LatinHypercube(d, seed = rng).random(m)
+    if sampling == "sobol":
+        with warnings.catch_warnings():
+            # Balance properties are best for powers of 2, other sizes are still valid
+            warnings.simplefilter("ignore", UserWarning)
+            return qmc.Sobol(d, scramble = True, seed = rng).random(m)
+    raise ValueError("Unknown sampling scheme " + str(sampling))
+
+# Arguments of simulate_batch shared by every block in a worker process
+_simulationArgs = None
+
+def _InitSimulationWorker(args):
+    global _simulationArgs
+    _simulationArgs = args
+
+def _SimulationBlock(task, args=None):
+    seedSeq, size = task
+    routes, locationData, fsSamp, pkSamp, nwSamp, wknd, sampling = args if args is not None else _simulationArgs
+    return simulate_batch(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=wknd, n=size, rng=np.random.default_rng(seedSeq), sampling=sampling)
+
+def simulate_parallel(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False, n=1000, seed=None, workers=1, block=10000, sampling="iid"):
+    ''' Reproducible simulate_batch over several processes.
+
+    Inputs:
+    routes, locationData, fsSamp, pkSamp, nwSamp, wknd:
+        as for simulate_batch.
+    n: int
+        Number of scenarios.
+    seed: int/np.random.SeedSequence
+        Base seed, the same seed always gives the same costs. Fresh OS entropy if None
+        (pass a SeedSequence and keep its entropy to be able to reproduce the run).
+    workers: int
+        Number of worker processes, 1 runs in this process.
+    block: int
+        Scenarios per random stream.
+    sampling: string
+        Sampling scheme, see draw_uniforms (each block is its own design).
+
+    Outputs:
+    opt: np.array
+        optimal solution value for each of the n scenarios
+
+    Notes:
+        The scenarios are cut into fixed size blocks and every block gets its own stream from
+        SeedSequence.spawn. Blocks (not workers) own the streams and are merged in block order,
+        so the result is bit-identical for any number of workers.
+    '''
+    seedSeq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    sizes = [min(block, n - start) for start in range(0, n, block)]
+    # Spawn from a copy so calling again with the same SeedSequence repeats the run
+    streams = np.random.SeedSequence(seedSeq.entropy, spawn_key = seedSeq.spawn_key).spawn(len(sizes))
+    tasks = list(zip(streams, sizes))
+    args = (routes, locationData, fsSamp, pkSamp, nwSamp, wknd, sampling)
+
+    start = time.perf_counter()
+    with tracer.stage("simulation", routes=len(routes), wknd=wknd, sampling=sampling, workers=workers):
+        if workers <= 1 or len(tasks) <= 1:
+            results = [_SimulationBlock(task, args) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers = workers, initializer = _InitSimulationWorker, initargs = (args,)) as pool:
+                results = list(pool.map(_SimulationBlock, tasks))
+    _record_scenarios(n, time.perf_counter() - start)
+    return np.concatenate(results) if results else np.empty(0)
+
+def _record_scenarios(n, seconds):
+    # Scenario throughput of a simulation run for the trace
+    tracer.count("simulation.scenarios", n)
+    tracer.event("simulation", scenarios=n, seconds=seconds, scenariosPerSecond=n/seconds if seconds > 0 else None)
+
+def simulate_until(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False, halfWidth=10, alpha=0.05,
+                   maxScenarios=1000*1000, minScenarios=10*1024, seed=None, block=1024, summary=None, sampling="iid"):
+    ''' Streams simulate_batch blocks into a SimulationSummary until the confidence interval
+    for the mean cost is narrow enough.
+
+    Each block has its own random stream (and its own antithetic/LHS/Sobol design), so the
+    block means are independent replicates. The interval is taken over them, which is what
+    lets a variance reducing scheme stop after fewer scenarios than i.i.d. sampling.
+
+    Inputs:
+    routes, locationData, fsSamp, pkSamp, nwSamp, wknd:
+        as for simulate_batch.
+    halfWidth: float
+        Stop once the (1 - alpha) confidence interval half width is below this many dollars.
+    alpha: float
+        Significance level of the interval.
+    maxScenarios, minScenarios: int
+        Budget, and number of scenarios to always run before checking the interval (10
+        replicates by default, enough for the t interval to be reliable).
+    seed, block, sampling:
+        as for simulate_parallel, the costs seen are the first scenarios of
+        simulate_parallel(..., seed=seed, block=block, sampling=sampling). block is also the
+        replicate size, a power of 2 suits Sobol sampling.
+    summary: SimulationSummary
+        Accumulator to add to, a new one if None.
+
+    Outputs:
+    summary: SimulationSummary
+        mean/variance, quantiles and histogram of the costs, memory does not grow with the
+        number of scenarios
+    '''
+    if summary is None:
+        summary = SimulationSummary()
+    seedSeq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    # Spawning one child at a time gives the same streams as simulate_parallel's spawn(nBlocks)
+    streams = np.random.SeedSequence(seedSeq.entropy, spawn_key = seedSeq.spawn_key)
+    args = (routes, locationData, fsSamp, pkSamp, nwSamp, wknd, sampling)
+
+    done = 0
+    start = time.perf_counter()
+    with tracer.stage("simulation", routes=len(routes), wknd=wknd, sampling=sampling):
+        while done < maxScenarios:
+            size = min(block, maxScenarios - done)
+            summary.update(_SimulationBlock((streams.spawn(1)[0], size), args))
+            done += size
+            if done >= minScenarios and summary.halfWidth(alpha) < halfWidth:
+                break
+    _record_scenarios(done, time.perf_counter() - start)
+    return summary
+
+def variance_reduction(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False, sampling="iid", n=1000, replicates=20, seed=None):
+    ''' Effective variance reduction of a sampling scheme for the mean cost.
+
+    Runs independent replicates of n scenarios and compares the spread of the replicate means
+    with the variance plain i.i.d. sampling would give, s^2/n.
+
+    Inputs:
+    routes, locationData, fsSamp, pkSamp, nwSamp, wknd:
+        as for simulate_batch.
+    sampling: string
+        scheme to assess, see draw_uniforms.
+    n, replicates: int
+        Scenarios per replicate and number of replicates.
+    seed: int/np.random.SeedSequence
+        Base seed.
+
+    Outputs:
+    report: dict
+        mean cost, estimator variance of the scheme and of i.i.d. sampling, their ratio
+        (reduction) and how many i.i.d. scenarios n scenarios of the scheme are worth
+    '''
+    seedSeq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    # Spawn from a copy so calling again with the same SeedSequence repeats the run
+    streams = np.random.SeedSequence(seedSeq.entropy, spawn_key = seedSeq.spawn_key).spawn(replicates)
+    runs = np.array([simulate_batch(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=wknd, n=n,
+                                    rng=np.random.default_rng(stream), sampling=sampling) for stream in streams])
+    schemeVariance = runs.mean(axis = 1).var(ddof = 1)
+    iidVariance = runs.var(ddof = 1)/n
+    reduction = iidVariance/schemeVariance if schemeVariance > 0 else np.inf
+    return {"sampling": sampling, "mean": float(runs.mean()), "variance": float(schemeVariance),
+            "iidVariance": float(iidVariance), "reduction": float(reduction), "equivalentScenarios": float(n*reduction)}
+
+def compare_schedules(routesA, samplesA, routesB, samplesB, locationData, wkndA=False, wkndB=False, n=10000,
+                      seed=None, sampling="iid", common=True):
+    ''' Simulates two schedules (e.g. weekday vs weekend, or two candidate route sets) and
+    estimates the difference in mean cost.
+
+    Inputs:
+    routesA, routesB: DataFrame
+        Route/Cost of each schedule.
+    samplesA, samplesB: list
+        [fsSamp, pkSamp, nwSamp] demand samples for each schedule (see setupbootstrap).
+    locationData: DataFrame
+        Store types.
+    wkndA, wkndB: Bool
+        Whether each schedule is run on Saturday.
+    n: int
+        Number of scenarios.
+    seed: int/np.random.SeedSequence
+        Base seed.
+    sampling: string
+        Sampling scheme, see draw_uniforms.
+    common: Bool
+        True to use common random numbers: both schedules see the same uniforms, so the same
+        demand quantiles and the same traffic on their i-th route.
+
+    Outputs:
+    diff: np.array
+        cost of A minus cost of B in each scenario
+    report: dict
+        mean difference, its variance and the variance reduction over independent sampling
+        (var(A) + var(B))/var(A - B)
+    '''
+    arraysA = _route_arrays(routesA, locationData, wkndA)
+    arraysB = _route_arrays(routesB, locationData, wkndB)
+    samplesA = [np.asarray(s, dtype = float) for s in samplesA]
+    samplesB = [np.asarray(s, dtype = float) for s in samplesB]
+    d = len(storeTypes) + max(len(arraysA[0]), len(arraysB[0]))
+
+    seedSeq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    streamA, streamB = np.random.SeedSequence(seedSeq.entropy, spawn_key = seedSeq.spawn_key).spawn(2)
+    UA = draw_uniforms(n, d, np.random.default_rng(streamA), sampling)
+    UB = UA if common else draw_uniforms(n, d, np.random.default_rng(streamB), sampling)
+    costA = _scenario_costs(*arraysA, samplesA, UA)
+    costB = _scenario_costs(*arraysB, samplesB, UB)
+
+    diff = costA - costB
+    diffVariance = diff.var(ddof = 1)
+    independentVariance = costA.var(ddof = 1) + costB.var(ddof = 1)
+    reduction = independentVariance/diffVariance if diffVariance > 0 else np.inf
+    return diff, {"mean": float(diff.mean()), "variance": float(diffVariance/n),
+                  "independentVariance": float(independentVariance/n), "reduction": float(reduction)}
+
+def simulate_matrices(routes, locationData, fsSamp, pkSamp, nwSamp, wknd=False, n=1000, rng=None, timeData=None, chunk=1000):
+    ''' Like simulate_batch but with arc level traffic: every scenario draws a perturbed travel
+    time matrix for the morning and one for the afternoon and each route is re-costed against
+    the matrix of its shift.
+
+    Inputs:
+    routes, locationData, fsSamp, pkSamp, nwSamp, wknd, n, rng:
+        as for simulate_batch.
+    timeData: TravelTimeMatrix
+        travel times to perturb. loaded (through the binary cache) if not given.
+    chunk: int
+        Scenarios per batch of matrices, memory is about 2 x chunk x n x n floats.
+
+    Outputs:
+    opt: np.array
+        optimal solution value for each of the n scenarios
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    if timeData is None:
+        timeData = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv")
+    costs, tol, last = _route_arrays(routes, locationData, wknd)
+    samples = [np.asarray(s, dtype = float) for s in (fsSamp, pkSamp, nwSamp)]
+    routeList = list(routes['Route'])
+    morning = np.arange(len(routeList)) % 2 == 0
+    shifts = [(shift, np.flatnonzero(mask)) for shift, mask in (("morning", morning), ("afternoon", ~morning))]
+
+    opt = np.empty(n)
+    for start in range(0, n, chunk):
+        m = min(chunk, n - start)
+        demands = _draw_demands(samples, rng.random((m, len(samples))))
+        time = np.empty((m, len(routeList)))
+        for shift, idx in shifts:
+            if len(idx):
+                matrices = generate_time_matrices(m, weekend=wknd, shift=shift, timeData=timeData, rng=rng)
+                time[:, idx] = recost_routes([routeList[i] for i in idx], matrices, timeData)
+        opt[start:start+m] = _schedule_costs(time/3600, demands, last)
+    return opt
@@ -0,0 +1,145 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, LinearConstraint, Bounds
+import pulp
+from instrument import tracer
+
+# Backend used when a caller does not ask for one: "highs" solves in-process with
+# scipy.optimize.milp, "pulp" goes through PuLP's default solver (CBC subprocess)
+defaultBackend = "highs"
+
+# Debug option, True to write every model to <name>.lp before it is solved
+debugWriteLP = False
+
+class BinaryModel:
+    '''
+    Binary integer program in matrix form
+
+        min/max  c x
+        s.t.     rowLower <= A x <= rowUpper
+                 x binary
+
+    Inputs
+    ------
+    c : array-like
+    Objective coefficient of each variable
+
+    name : string
+    Name of the model (also the .lp file name when writing it out)
+
+    maximise : boolean
+    True to maximise the objective
+
+    varName : string
+    Prefix of the variable names, variable i is called varName_i
+    '''
+
+    def __init__(self, c, name = "Model", maximise = False, varName = "x"):
+        self.c = np.asarray(c, dtype = float)
+        self.name = name
+        self.maximise = maximise
+        self.varName = varName
+        self.A = sp.csr_matrix((0, len(self.c)))
+        self.rowLower = np.empty(0)
+        self.rowUpper = np.empty(0)
+        self.rowNames = []
+
+    def addRows(self, A, lower = -np.inf, upper = np.inf, names = None):
+        '''
+        Append constraint rows, A is a (sparse or dense) matrix or a single dense row
+        '''
+        A = sp.csr_matrix(np.atleast_2d(A) if not sp.issparse(A) else A)
+        m = A.shape[0]
+        self.A = sp.vstack([self.A, A], format = "csr")
+        self.rowLower = np.concatenate([self.rowLower, np.broadcast_to(np.asarray(lower, dtype = float), m)])
+        self.rowUpper = np.concatenate([self.rowUpper, np.broadcast_to(np.asarray(upper, dtype = float), m)])
+        self.rowNames += list(names) if names is not None else [None]*m
+
+    def toPulp(self):
+        '''
+        Equivalent PuLP problem and its variables
+        '''
+        prob = pulp.LpProblem(self.name, pulp.LpMaximize if self.maximise else pulp.LpMinimize)
+        xVars = pulp.LpVariable.dicts(self.varName, range(len(self.c)), 0, cat = "Binary")
+        prob.setObjective(pulp.LpAffineExpression([(xVars[j], self.c[j]) for j in range(len(self.c))]))
+
+        A = self.A.tocsr()
+        for r in range(A.shape[0]):
+            cols = A.indices[A.indptr[r]:A.indptr[r+1]]
+            vals = A.data[A.indptr[r]:A.indptr[r+1]]
+            expr = pulp.LpAffineExpression([(xVars[j], v) for j, v in zip(cols, vals)])
+            lower, upper, name = self.rowLower[r], self.rowUpper[r], self.rowNames[r]
+            if lower == upper:
+                prob += expr == upper, name
+            else:
+                if np.isfinite(upper):
+                    prob += expr <= upper, name
+                if np.isfinite(lower):
+                    prob += expr >= lower, (name + "_lower" if name and np.isfinite(upper) else name)
+        return prob, xVars
+
+def Solve(model, backend = None, writeLP = None):
+    '''
+    Solve a BinaryModel
+
+    Inputs
+    ------
+    model : BinaryModel
+
+    backend : string
+    "highs" (in-process scipy.optimize.milp) or "pulp", defaultBackend if None
+
+    writeLP : boolean
+    True to write the model to <model.name>.lp first, debugWriteLP if None
+
+    Returns
+    -------
+    status : string
+        PuLP style status, "Optimal" when an optimal solution was found
+    x : np.array
+        value of each variable (rounded to 0/1), None unless optimal
+    obj : float
+        objective function value, None unless optimal
+    '''
+    if backend is None:
+        backend = defaultBackend
+    if writeLP is None:
+        writeLP = debugWriteLP
+
+    with tracer.timer("solver"):
+        status, x, obj = _Solve(model, backend, writeLP)
+    tracer.event("lp", model = model.name, backend = backend, rows = model.A.shape[0], cols = len(model.c), nnz = model.A.nnz,
+                 status = status)
+    return status, x, obj
+
+def _Solve(model, backend, writeLP):
+
+    prob = None
+    if writeLP or backend == "pulp":
+        prob, xVars = model.toPulp()
+        if writeLP:
+            prob.writeLP(model.name + ".lp")
+
+    if backend == "pulp":
+        prob.solve()
+        status = pulp.LpStatus[prob.status]
+        if status != "Optimal":
+            return status, None, None
+        x = np.array([xVars[j].varValue for j in range(len(model.c))], dtype = float)
+        return status, np.round(x), pulp.value(prob.objective)
+
+    if backend == "highs":
+        c = -model.c if model.maximise else model.c
+        constraints = [LinearConstraint(model.A, model.rowLower, model.rowUpper)] if model.A.shape[0] else []
+        res = milp(c, constraints = constraints, integrality = np.ones(len(c)), bounds = Bounds(0, 1))
+        if res.status != 0 or res.x is None:
+            return ("Infeasible" if res.status == 2 else "Not Solved"), None, None
+        x = np.round(res.x)
+        return "Optimal", x, float(model.c @ x)
+
+    raise ValueError("Unknown solver backend " + str(backend))
@@ -0,0 +1,121 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import numpy as np
+import pandas as pd
+from os import sep
+from instrument import tracer
+
+# Store types the demand model and the simulation know about, type codes 0, 1, 2
+storeTypes = ["Four Square", "Pak 'n Save", "New World"]
+
+# Stores whose type in FoodstuffLocations.csv is not one we model, mapped to the closest type
+typeFixes = {"Fresh Collective Alberton": "Four Square"}
+
+def ReadLocations(path = "Data" + sep + "FoodstuffLocations.csv", fixTypes = True):
+    '''
+    Read the supermarket locations (warehouse included) with the store type fix-ups applied,
+    fixTypes = False for the types exactly as in the csv
+    '''
+    with tracer.stage("csv.read", path = path):
+        locationData = pd.read_csv(path)
+    for store, storeType in (typeFixes.items() if fixTypes else []):
+        locationData.loc[locationData["Supermarket"] == store, "Type"] = storeType
+    return locationData
+
+class StoreRegistry:
+    '''
+    Interns store names to integer ids (row order of the locations) and holds their
+    attributes as arrays so lookups are O(1) indexing instead of dataframe scans
+
+    Inputs
+    ------
+    locationData : pd.DataFrame
+    Supermarket/Type/Long/Lat of every store (see ReadLocations)
+
+    demandPreds : pd.DataFrame
+    Optional "Supermarket Type"/Weekday/Demand predictions (demandModel.csv)
+
+    Attributes
+    ----------
+    names : list
+    Store name of each id
+
+    index : dict
+    Store name -> id
+
+    typeNames : list
+    Type of each type code, storeTypes first then any other type (e.g. Warehouse)
+
+    typeCode : np.array (int8)
+    Type code of each store
+
+    coords : np.array
+    (stores x 2) Long, Lat of each store
+
+    weekdays : list
+    Weekdays with demand predictions
+
+    demand : np.array
+    (weekdays x stores) predicted demand, nan where the store type has no prediction
+    '''
+
+    def __init__(self, locationData, demandPreds = None):
+        self.names = list(locationData["Supermarket"])
+        self.index = {store: i for i, store in enumerate(self.names)}
+        types = list(locationData["Type"])
+        self.typeNames = storeTypes + [t for t in dict.fromkeys(types) if t not in storeTypes]
+        typePosition = {t: k for k, t in enumerate(self.typeNames)}
+        self.typeCode = np.array([typePosition[t] for t in types], dtype = np.int8)
+        if "Long" in locationData and "Lat" in locationData:
+            self.coords = locationData[["Long", "Lat"]].to_numpy(dtype = float)
+        else:
+            self.coords = np.full((len(self.names), 2), np.nan)
+
+        self.weekdays = []
+        self.demand = np.empty((0, len(self.names)))
+        if demandPreds is not None:
+            self.weekdays = list(dict.fromkeys(demandPreds["Weekday"]))
+            byType = np.full((len(self.weekdays), len(self.typeNames)), np.nan)
+            day = {d: k for k, d in enumerate(self.weekdays)}
+            for storeType, weekday, value in zip(demandPreds["Supermarket Type"], demandPreds["Weekday"], demandPreds["Demand"]):
+                if storeType in typePosition:
+                    byType[day[weekday], typePosition[storeType]] = value
+            self.demand = byType[:, self.typeCode]
+
+    @classmethod
+    def from_csv(cls, locationsPath = "Data" + sep + "FoodstuffLocations.csv", demandPath = "Data" + sep + "demandModel.csv"):
+        '''
+        Build from the csv files, demandPath = None to skip the demand predictions
+        '''
+        demandPreds = pd.read_csv(demandPath) if demandPath is not None else None
+        return cls(ReadLocations(locationsPath), demandPreds)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, store):
+        return store in self.index
+
+    def ids(self, stores):
+        '''
+        Integer ids of the given store names
+        '''
+        return np.array([self.index[store] for store in stores], dtype = np.intp)
+
+    def type_of(self, store):
+        return self.typeNames[self.typeCode[self.index[store]]]
+
+    def demands(self, stores, weekday):
+        '''
+        Predicted demand of each store on weekday
+        '''
+        return self.demand[self.weekdays.index(weekday), self.ids(stores)]
+
+    def coordinates(self, stores):
+        '''
+        (Long, Lat) of each store
+        '''
+        return self.coords[self.ids(stores)]
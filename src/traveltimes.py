@@ -0,0 +1,198 @@
+####################################################################################
+#
+# Import modules
+#
+####################################################################################
+import numpy as np
+import pandas as pd
+import hashlib
+import json
+import os
+from multiprocessing import shared_memory
+from instrument import tracer
+
+class TravelTimeMatrix:
+    '''
+    Travel times between supermarkets stored as a float64 ndarray plus a store name to index map
+
+    Attributes
+    ----------
+    W : np.ndarray
+    Square matrix where W[i, j] == timeData[stores[i]][stores[j]] for the label based
+    dataframe read from FoodstuffTravelTimes.csv (i.e. the transpose of the csv layout)
+
+    stores : list
+    Store names in matrix order
+
+    index : dict
+    Store name -> integer index into W
+
+    version : string
+    Hash of the csv the matrix was built from, changes whenever the travel times change
+
+    Notes:
+    ------
+    from_csv saves a binary sidecar next to the csv which later runs np.memmap instead of
+    re-parsing. The sidecar is invalidated by the csv's mtime and content hash.
+    '''
+
+    def __init__(self, W, stores, version = None):
+        self.W = W
+        self.stores = list(stores)
+        self.index = {store: i for i, store in enumerate(self.stores)}
+        self.version = version
+        self._shm = None
+
+    def __len__(self):
+        return len(self.stores)
+
+    def __contains__(self, store):
+        return store in self.index
+
+    @property
+    def shared(self):
+        '''
+        True if the matrix lives in (or is attached to) a shared memory block
+        '''
+        return self._shm is not None
+
+    def indices(self, stores):
+        '''
+        Integer indices of the given store names
+        '''
+        return np.array([self.index[store] for store in stores], dtype = np.intp)
+
+    def to_frame(self):
+        '''
+        Label based dataframe in the same layout as pd.read_csv(..., index_col = 0)
+        '''
+        return pd.DataFrame(np.array(self.W.T), index = self.stores, columns = self.stores)
+
+    @classmethod
+    def from_frame(cls, timeData, version = None):
+        '''
+        Build from a label based dataframe (index and columns must hold the same stores)
+        '''
+        stores = list(timeData.columns)
+        W = timeData.loc[stores, stores].to_numpy(dtype = np.float64).T.copy()
+        return cls(W, stores, version)
+
+    @classmethod
+    def from_csv(cls, path, cache = True):
+        '''
+        Load travel times from csv, going through the binary sidecar when it is still valid
+
+        Inputs
+        ------
+        path : string
+        Path to the travel time csv e.g. "Data" + sep + "FoodstuffTravelTimes.csv"
+
+        cache : boolean
+        False to always re-parse the csv and never touch the sidecar
+        '''
+        with tracer.stage("csv.read", path = path, cache = cache):
+            return cls._from_csv(path, cache)
+
+    @classmethod
+    def _from_csv(cls, path, cache):
+        if not cache:
+            return cls.from_frame(pd.read_csv(path, index_col = 0), _Version(_FileHash(path)))
+
+        binPath, metaPath = _SidecarPaths(path)
+        stat = os.stat(path)
+        meta = _ReadMeta(metaPath)
+
+        if meta is not None and os.path.exists(binPath):
+            # Cheap check first, only hash the csv when the mtime has moved
+            valid = meta["mtime"] == stat.st_mtime_ns and meta["size"] == stat.st_size
+            if not valid and meta["sha256"] == _FileHash(path):
+                meta["mtime"], meta["size"] = stat.st_mtime_ns, stat.st_size
+                _WriteMeta(metaPath, meta)
+                valid = True
+            if valid:
+                n = len(meta["stores"])
+                W = np.memmap(binPath, dtype = np.float64, mode = "r", shape = (n, n))
+                return cls(W, meta["stores"], _Version(meta["sha256"]))
+
+        # Sidecar missing or stale so re-parse the csv and rewrite it
+        digest = _FileHash(path)
+        matrix = cls.from_frame(pd.read_csv(path, index_col = 0), _Version(digest))
+        try:
+            # Unique per process so concurrent loads of the same csv never write into each other's file
+            tmpPath = binPath + ".tmp" + str(os.getpid())
+            np.ascontiguousarray(matrix.W, dtype = np.float64).tofile(tmpPath)
+            os.replace(tmpPath, binPath)
+            _WriteMeta(metaPath, {"mtime": stat.st_mtime_ns, "size": stat.st_size,
+                                  "sha256": digest, "stores": matrix.stores})
+        except OSError:
+            # Read only data directory, carry on without the sidecar
+            pass
+        return matrix
+
+    def share(self):
+        '''
+        Copy the matrix into a shared memory block so worker processes can attach without copying
+
+        Returns
+        -------
+        handle : tuple
+            picklable handle to pass to TravelTimeMatrix.attach in the worker
+        '''
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(create = True, size = self.W.nbytes)
+            W = np.ndarray(self.W.shape, dtype = np.float64, buffer = self._shm.buf)
+            W[:] = self.W
+            self.W = W
+        return (self._shm.name, self.W.shape, self.stores, self.version)
+
+    @classmethod
+    def attach(cls, handle):
+        '''
+        Attach to a matrix previously published with share() (read only view, no copy)
+        '''
+        name, shape, stores, version = handle
+        try:
+            shm = shared_memory.SharedMemory(name = name, track = False)
+        except TypeError:
+            # Python < 3.13, pool workers share the owner's resource tracker so registering again is harmless
+            shm = shared_memory.SharedMemory(name = name)
+        W = np.ndarray(shape, dtype = np.float64, buffer = shm.buf)
+        W.flags.writeable = False
+        matrix = cls(W, stores, version)
+        matrix._shm = shm
+        return matrix
+
+    def close(self, unlink = False):
+        '''
+        Release the shared memory block, unlink = True in the owning process once workers are done
+        '''
+        if self._shm is not None:
+            self.W = np.array(self.W)
+            self._shm.close()
+            if unlink:
+                self._shm.unlink()
+            self._shm = None
+
+def _SidecarPaths(path):
+    return path + ".ttm", path + ".ttm.json"
+
+def _FileHash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _Version(digest):
+    # The same version whether or not the sidecar was used, so TourCache keys match across both paths
+    return digest[:16]
+
+def _ReadMeta(metaPath):
+    try:
+        with open(metaPath) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _WriteMeta(metaPath, meta):
+    tmpPath = metaPath + ".tmp" + str(os.getpid())
+    with open(tmpPath, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmpPath, metaPath)
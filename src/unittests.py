@@ -6,6 +6,8 @@ from routeselectionV2 import *
 # from routeselection import *
 from RouteGen import *
 from ast import literal_eval
+from routepool import *
+from stores import *
 from simulation import *
 from scipy import stats
 
@@ -23,26 +25,46 @@ def TestCheapestInsertion():
 
 # TestCheapestInsertion()
 
+def TestCheapestInsertionArray():
+    # Integer engine on the real travel times should agree with the label based wrapper
+    timeData = pd.read_csv("Data" + sep + "FoodstuffTravelTimes.csv", index_col = 0)
+    W = timeData.to_numpy().T
+    nodes = list(timeData.columns[1:13])
+    finalTour, finalTourWeight = CheapestInsertion(nodes, timeData, centralNode = 'Warehouse')
+    tourIdx, tourIdxWeight = CheapestInsertionArray(list(range(1, 13)), W, centralNode = 0)
+    print("Tours match:", finalTour == [timeData.columns[i] for i in tourIdx], "\nWeights match:", finalTourWeight == tourIdxWeight)
+
+# TestCheapestInsertionArray()
+
+def TestLocalSearch():
+    # 2-opt/Or-opt should never lengthen a tour and should get close to the best tour of small node sets
+    from itertools import permutations
+    W = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv").W
+    rng = np.random.default_rng(0)
+    for i in range(5):
+        nodes = list(rng.choice(np.arange(1, len(W)), size = 7, replace = False))
+        tour, weight = CheapestInsertionArray(nodes, W, centralNode = 0)
+        walked = sum(W[tour[t], tour[t+1]] for t in range(len(tour) - 1))
+        improvedTour, improvedWeight = LocalSearchArray(tour, W)
+        best = min(sum(W[a, b] for a, b in zip((0,) + p, p + (0,))) for p in permutations(nodes))
+        print("Insertion:", weight, "Walked:", walked, "Local search:", improvedWeight, "Best:", best)
+
+# TestLocalSearch()
+
 def TestRouteGeneration(): 
     # Import data
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+    locationData = ReadLocations()
     locationData = locationData[1:][:]
-    timeData = pd.read_csv("Data" + sep + "FoodstuffTravelTimes.csv", index_col = 0)
+    timeData = TravelTimeMatrix.from_csv("Data" + sep + "FoodstuffTravelTimes.csv")
     demandPreds = pd.read_csv("Data" + sep + "demandModel.csv")
 
     # Generate k means 
     l = KRegionalClusters(locationData, k=2, plot=False)
 
     # Construct routes based on k means 
-    routeData1, stores = RouteConstruction(locationData, timeData, l, demandPreds, "Monday")
-    frame = [routeData1]
-    for i in range(1,12):
-        routeData2, stores = RouteConstruction2(locationData, timeData, l, demandPreds, "Monday", min = i)
-        frame.append(routeData2)
-    routeData = pd.concat(frame, ignore_index = True)
+    routeData, stores = RoutePool(locationData, timeData, l, demandPreds, "Monday")
     # Save current solution so we do not need to run again 
-    routeData.to_csv("Data" + sep + "UnitTest" + sep + "generatedRoutesWeekday.csv", index=False)
+    WriteRoutes(routeData, "Data" + sep + "UnitTest" + sep + "generatedRoutesWeekday.csv")
 
 # TestRouteGeneration()
 
@@ -70,9 +92,8 @@ def TestRouteSelection():
 
         # Load data so we DO NOT need to run route gen again 
         # Below tests route selection 
-        routeData = pd.read_csv("Data" + sep + "generatedRoutesWeekday.csv", converters = {"Route": literal_eval})
-        locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-        locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+        routeData = ReadRoutes("Data" + sep + "generatedRoutesWeekday.csv")
+        locationData = ReadLocations()
         supermarkets = list(locationData["Supermarket"])
         supermarkets.remove('Warehouse')
 
@@ -99,18 +120,17 @@ def TestRouteSelection():
 
 def TestRunSimulation():
     # Initialise list of optimal solution routes
-    weekRoutes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + "Monday" + ".csv", converters = {"Route": literal_eval})
-    wkndRoutes = pd.read_csv("Data" + sep + "Routes" + sep + "optimalRoutes" + "Saturday" + ".csv", converters = {"Route": literal_eval})
+    weekRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + "Monday" + ".csv")
+    wkndRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + "Saturday" + ".csv")
 
     # Get cleaned dataframe
     demandData = pd.read_csv("Data" + sep + "demandData.csv")
-    locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-    demandData = clean_data(demandData,locationData)
-    locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
-    demandData = setupbootstrap(demandData)
+    locationData = ReadLocations()
+    demandData = clean_data(demandData, ReadLocations(fixTypes = False))
+    registry = StoreRegistry(locationData)
 
-    wopt = simulate(weekRoutes, demandData, locationData, wknd=False)
-    opt = simulate(wkndRoutes, demandData, locationData, wknd=True)
+    wopt = simulate(weekRoutes, registry, *setupbootstrap(demandData, wknd=False), wknd=False)
+    opt = simulate(wkndRoutes, registry, *setupbootstrap(demandData, wknd=True), wknd=True)
     # Import travel times between supermarkets + demand predictions per store 
 
 
@@ -118,6 +138,25 @@ print(stats.norm.rvs(loc=10, scale =2, size =100))
 
 # TestRunSimulation()
 
+def TestSimulationSeeds():
+    # variance_reduction and compare_schedules should take a spawned SeedSequence (as RunSimulation passes)
+    # as well as an int, and repeat their results when given the same one
+    weekRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + "Monday" + ".csv")
+    wkndRoutes = ReadRoutes("Data" + sep + "Routes" + sep + "optimalRoutes" + "Saturday" + ".csv")
+    locationData = ReadLocations()
+    demandData = clean_data(pd.read_csv("Data" + sep + "demandData.csv"), ReadLocations(fixTypes = False))
+    weekSamples, wkndSamples = setupbootstrap(demandData, wknd = False), setupbootstrap(demandData, wknd = True)
+
+    weekSeed, wkndSeed = np.random.SeedSequence(0).spawn(2)
+    first = variance_reduction(weekRoutes, locationData, *weekSamples, seed = weekSeed)
+    second = variance_reduction(weekRoutes, locationData, *weekSamples, seed = weekSeed)
+    print("variance_reduction repeats:", first == second, first["reduction"])
+    diff, report = compare_schedules(weekRoutes, weekSamples, wkndRoutes, wkndSamples, locationData, wkndB = True, n = 1000, seed = wkndSeed)
+    diffAgain, report = compare_schedules(weekRoutes, weekSamples, wkndRoutes, wkndSamples, locationData, wkndB = True, n = 1000, seed = wkndSeed)
+    print("compare_schedules repeats:", np.array_equal(diff, diffAgain), report)
+
+# TestSimulationSeeds()
+
 
 # test = ['Warehouse', 'Pak \'n Save Mangere', 'Warehouse']
 # print(test)
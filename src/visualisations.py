@@ -3,18 +3,150 @@ ORSkey = '5b3ce3597851110001cf6248b1727d42fc2949e6b106028a682c47a0'
 import numpy as np
 import pandas as pd
 import folium
-import openrouteservice as ors
 from ast import literal_eval
+import os
 from os import sep
 import seaborn as sns
+from stores import StoreRegistry
+import hashlib
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-locationData = pd.read_csv("Data" + sep + "FoodstuffLocations.csv")
-locationData.loc[locationData["Supermarket"] == "Fresh Collective Alberton", "Type"] = "Four Square"
+class ORSProvider:
+    '''
+    Road geometry from openrouteservice
+
+    Inputs
+    ------
+    key : string
+    API key
+
+    profile : string
+    Routing profile, trucks by default
+
+    base_url : string
+    Server to ask, e.g. a local openrouteservice instance, the public API if None
+    '''
+
+    def __init__(self, key=ORSkey, profile='driving-hgv', base_url=None):
+        import openrouteservice as ors
+        self.profile = profile
+        self.client = ors.Client(key=key) if base_url is None else ors.Client(key=key, base_url=base_url)
+
+    def directions(self, coords):
+        route = self.client.directions(
+            coordinates = coords,
+            profile     = self.profile,
+            format      = 'geojson',
+            validate    = False
+        )
+        return route['features'][0]['geometry']['coordinates']
+
+class StraightLineProvider:
+    '''
+    Offline stand-in for ORSProvider, the "road" is the straight line through the stops
+    '''
+    profile = 'straight-line'
+
+    def directions(self, coords):
+        return [list(coord) for coord in coords]
+
+class GeometryCache:
+    '''
+    On-disk cache of route geometry, one json file per (profile, ordered coordinates)
+
+    Inputs
+    ------
+    path : string
+    Directory of the cache
+    '''
+
+    def __init__(self, path="Data" + sep + "Cache" + sep + "geometry"):
+        self.path = path
+
+    @staticmethod
+    def key(profile, coords):
+        return hashlib.sha256(json.dumps([profile, [list(map(float, c)) for c in coords]]).encode()).hexdigest()
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.path, key + '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, geometry):
+        os.makedirs(self.path, exist_ok=True)
+        tmpPath = os.path.join(self.path, key + '.json.tmp' + str(os.getpid()))
+        with open(tmpPath, 'w') as f:
+            json.dump(geometry, f)
+        os.replace(tmpPath, os.path.join(self.path, key + '.json'))
+
+def FetchGeometries(coordSeqs, provider=None, cache=None, workers=4, retries=3, backoff=1.0):
+    '''
+    Geometry of every coordinate sequence, from the cache where possible and otherwise
+    fetched from the provider with at most workers requests in flight
+
+    Inputs:
+        coordSeqs : list
+            One list of [Long, Lat] stops per route
+        provider : ORSProvider/StraightLineProvider
+            Anything with a profile and a directions(coords) method, ORSProvider() if None
+        cache : GeometryCache
+            GeometryCache() if None, False to not cache
+        workers : int
+            Maximum number of concurrent requests
+        retries : int
+            Attempts after the first one before giving up on a route
+        backoff : float
+            Seconds to wait before the first retry, doubling (plus jitter) each time
+
+    Outputs:
+        geometries : list
+            [Long, Lat] points of each route, same order as coordSeqs
+    '''
+    if provider is None:
+        provider = ORSProvider()
+    if cache is None:
+        cache = GeometryCache()
+
+    keys = [GeometryCache.key(provider.profile, coords) for coords in coordSeqs]
+    found = {}
+    missing = {}
+    for key, coords in zip(keys, coordSeqs):
+        if key in found or key in missing:
+            continue
+        geometry = cache.get(key) if cache else None
+        if geometry is None:
+            missing[key] = coords
+        else:
+            found[key] = geometry
+
+    def Fetch(item):
+        key, coords = item
+        for attempt in range(retries + 1):
+            try:
+                geometry = provider.directions(coords)
+                break
+            except Exception:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff*2**attempt*(1 + random.random()))
+        if cache:
+            cache.put(key, geometry)
+        return key, geometry
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+            found.update(pool.map(Fetch, missing.items()))
+    return [found[key] for key in keys]
 
 def getindex(locations, store):
     return locations.loc[locations["Supermarket"] == store].index[0]
 
-def VisualiseRoutes(locations, routes, name=None, times=None, demands=None): # TODO add more arguments depending on output of routeselection
+def VisualiseRoutes(locations, routes, name=None, times=None, demands=None, path="", provider=None, cache=None, workers=4): # TODO add more arguments depending on output of routeselection
     """
     This function plots the travel path of routes on a folium map in different colours.
 
@@ -27,79 +159,55 @@ def VisualiseRoutes(locations, routes, name=None, times=None, demands=None): # T
             Array representing times for each route for potential visualisation
         demands : array-like ? TODO
             Array representing demands for each route for potential visualisation
+        path : string
+            Directory to save the maps in, the working directory by default
+        provider, cache, workers
+            Where the road geometry comes from, see FetchGeometries
 
     Outputs:
         routes_map.html
             An HTML file containing an interactive map with supermarket locations and routes plotted
     """
-    coords = locations[['Long', 'Lat']]
-    coords = coords.to_numpy().tolist()
+    registry = StoreRegistry(locations)
+    coords = registry.coords.tolist()
 
     # Initialise folium map
     m = folium.Map(location = list(reversed(coords[0])), zoom_start=10)
 
-    # Draw warehouse node
-    folium.Marker(list(reversed(coords[0])), popup = locations.Supermarket[0], icon = folium.Icon(color = 'black')).add_to(m)
-
-    # Draw supermarket nodes
-    for i in range(1, len(coords)):
-        if locations.Type[i] == "New World":
-            iconCol = "red"
-        elif locations.Type[i] == "Pak 'n Save":
-            iconCol = "orange"
-        else:
-            iconCol = "green"
-        folium.Marker(list(reversed(coords[i])), popup = locations.Supermarket[i], icon = folium.Icon(color = iconCol)).add_to(m)
+    # Draw warehouse and supermarket nodes
+    StoreMarkers(registry).add_to(m)
 
     palette = sns.color_palette("husl", 20).as_hex()
 
-    # Fetch and draw routes
-    client = ors.Client(key=ORSkey)
+    # Fetch (or read from the cache) and draw routes
+    geometries = FetchGeometries([[coords[registry.index[store]] for store in stores] for stores in routes], provider, cache, workers)
 
     #lineColors = ["red", "orange", "green", "blue", "black"]
     for i in range(len(routes)):
-        stores = routes[i]
-        print(stores)
-        route = client.directions(
-            coordinates = [coords[getindex(locations, store)] for store in stores],
-            profile     = 'driving-hgv',
-            format      = 'geojson',
-            validate    = False
-        )
         lineCol = palette[i % len(palette)]
-        folium.PolyLine(locations = [list(reversed(coord)) for coord in route['features'][0]['geometry']['coordinates']], color = lineCol).add_to(m)
+        folium.PolyLine(locations = [list(reversed(coord)) for coord in geometries[i]], color = lineCol).add_to(m)
     if name:
-        m.save('routes_map_' + name + '.html')
+        m.save(os.path.join(path, 'routes_map_' + name + '.html'))
     else:
-        m.save('routes_map.html')
+        m.save(os.path.join(path, 'routes_map.html'))
 
 
     ################################################################
     # Map 2
     m2 = folium.Map(location = list(reversed(coords[0])), zoom_start=10)
 
-    # Draw warehouse node
-    folium.Marker(list(reversed(coords[0])), popup = locations.Supermarket[0], icon = folium.Icon(color = 'black')).add_to(m2)
-
-    # Draw supermarket nodes
-    for i in range(1, len(coords)):
-        if locations.Type[i] == "New World":
-            iconCol = "red"
-        elif locations.Type[i] == "Pak 'n Save":
-            iconCol = "orange"
-        else:
-            iconCol = "green"
-        folium.Marker(list(reversed(coords[i])), popup = locations.Supermarket[i], icon = folium.Icon(color = iconCol)).add_to(m2)
+    # Draw warehouse and supermarket nodes
+    StoreMarkers(registry).add_to(m2)
 
     # Fetch and draw routes
     for i in range(len(routes)):
         lineCol = palette[i % len(palette)]
-        folium.PolyLine(locations = [list(reversed(coords[getindex(locations, store)])) for store in routes[i]], color = lineCol).add_to(m2)
+        folium.PolyLine(locations = [list(reversed(coords[registry.index[store]])) for store in routes[i]], color = lineCol).add_to(m2)
 
     if name:
-        m2.save('routes_straightline_map_' + name + '.html')
+        m2.save(os.path.join(path, 'routes_straightline_map_' + name + '.html'))
     else:
-        m2.save('routes_straightline_map.html')
+        m2.save(os.path.join(path, 'routes_straightline_map.html'))
     '''
     ################################################################
     # Map 3
@@ -121,12 +229,75 @@ def VisualiseRoutes(locations, routes, name=None, times=None, demands=None): # T
     # Fetch and draw routes
     for i in range(len(routes)):
         lineCol = palette[i % len(palette)]
-        folium.PolyLine(locations = [list(reversed(coords[getindex(locations, store)])) for store in routes[i]], color = lineCol).add_to(m2)
+        folium.PolyLine(locations = [list(reversed(coords[registry.index[store]])) for store in routes[i]], color = lineCol).add_to(m2)
 
     m2.save('routes_straightline_map.html')
     '''
 
 
+# Marker colour of each store type, anything else (e.g. Four Square) is green
+markerColours = {"Warehouse": "black", "New World": "red", "Pak 'n Save": "orange"}
+
+def StoreMarkers(registry, name="Stores"):
+    '''
+    Layer with a marker for the warehouse and every supermarket, colour coded by type
+    '''
+    layer = folium.FeatureGroup(name=name, control=False)
+    latLong = registry.coords[:, ::-1].tolist()
+    for i, store in enumerate(registry.names):
+        colour = markerColours.get(registry.typeNames[registry.typeCode[i]], "green")
+        folium.Marker(latLong[i], popup = store, icon = folium.Icon(color = colour)).add_to(layer)
+    return layer
+
+def VisualiseWeek(locations, routeSets, name="week", path="", provider=None, cache=None, workers=4):
+    """
+    Draws the routes of several days on one map in a single pass: the store markers are built
+    once and every day gets a road layer and a straight line layer that can be toggled.
+
+    Inputs:
+        locations : pandas.DataFrame
+            The dataframe containing store names and coordinates
+        routeSets : dict
+            Day -> list of lists of store names, e.g. {"Monday": [...], "Saturday": [...]}
+        name : string
+            The map is saved as routes_map_<name>.html
+        path : string
+            Directory to save the map in
+        provider, cache, workers
+            Where the road geometry comes from, see FetchGeometries
+
+    Outputs:
+        routes_map_<name>.html
+            An HTML file containing an interactive map with a layer per day and style
+    """
+    registry = StoreRegistry(locations)
+    latLong = registry.coords[:, ::-1]
+    warehouse = latLong[registry.index["Warehouse"]] if "Warehouse" in registry else latLong[0]
+
+    m = folium.Map(location = warehouse.tolist(), zoom_start=10)
+    StoreMarkers(registry).add_to(m)
+
+    # Stop ids of every route, then all the road geometry in one (cached, concurrent) batch
+    days = list(routeSets)
+    stops = [[registry.ids(route) for route in routeSets[day]] for day in days]
+    allStops = [ids for dayStops in stops for ids in dayStops]
+    geometries = iter(FetchGeometries([registry.coords[ids].tolist() for ids in allStops], provider, cache, workers))
+
+    palette = sns.color_palette("husl", 20).as_hex()
+    for d, day in enumerate(days):
+        road = folium.FeatureGroup(name=day + " (roads)", show=(d == 0))
+        straight = folium.FeatureGroup(name=day + " (straight line)", show=False)
+        for i, ids in enumerate(stops[d]):
+            lineCol = palette[i % len(palette)]
+            folium.PolyLine(locations = [[lat, lon] for lon, lat in next(geometries)], color = lineCol).add_to(road)
+            folium.PolyLine(locations = latLong[ids].tolist(), color = lineCol).add_to(straight)
+        road.add_to(m)
+        straight.add_to(m)
+
+    folium.LayerControl(collapsed=False).add_to(m)
+    m.save(os.path.join(path, 'routes_map_' + name + '.html'))
+    return m
+
 '''
 optimalSolution = pd.read_csv("Data" + sep + "chosenRoutes.csv", converters = {"Route": literal_eval})
 print(optimalSolution)